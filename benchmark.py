@@ -0,0 +1,271 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import statistics
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import httpx
+import pandas as pd
+import psutil
+
+import main
+from standin import StandInSite
+
+
+class MemorySampler:
+    """Фоновый замер пикового объема памяти (RSS) текущего процесса и всех его дочерних процессов (браузеров)."""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self) -> "MemorySampler":
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+
+    def sample(self) -> None:
+        process = psutil.Process()
+        rss = 0
+        for _process in [process] + process.children(recursive=True):
+            try:
+                rss += _process.memory_info().rss
+            except psutil.NoSuchProcess:
+                continue
+        self.peak = max(self.peak, rss)
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+
+class TimingTransport(httpx.AsyncHTTPTransport):
+    """Транспорт httpx, который запоминает время начала запросов страниц товаров по их URL."""
+
+    def __init__(self, started: dict, **kwargs):
+        super().__init__(**kwargs)
+        self.started = started
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.startswith("/product-"):
+            self.started[str(request.url)] = time.perf_counter()
+        return await super().handle_async_request(request)
+
+
+def percentile(values: list, q: float) -> float:
+    """Функция возвращает q-й процентиль значений (0, если значений нет)."""
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+@contextlib.contextmanager
+def record_product_timings(engine: str, timings: list):
+    """
+    Контекстный менеджер, который на время замера собирает время обработки каждого товара в timings.
+
+    Для engine="http" время отсчитывается от начала запроса страницы до окончания ее разбора (parse_product_html),
+    для браузера - время scrape_product. Ожидание ограничителя частоты запросов в замер не входит.
+    """
+    if engine == "http":
+        started: dict = {}
+        iter_pages = main.iter_pages
+        parse_product_html = main.parse_product_html
+
+        def timed_iter_pages(urls, concurrency=main.HTTP_CONCURRENCY, transport=None, limiter=None):
+            return iter_pages(urls, concurrency, transport or TimingTransport(started), limiter)
+
+        def timed_parse_product_html(html, url, number):
+            try:
+                return parse_product_html(html, url, number)
+            finally:
+                if url in started:
+                    timings.append(time.perf_counter() - started.pop(url))
+
+        with patch("main.iter_pages", timed_iter_pages), patch("main.parse_product_html", timed_parse_product_html):
+            yield
+    else:
+        scrape_product = main.scrape_product
+
+        def timed_scrape_product(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return scrape_product(*args, **kwargs)
+            finally:
+                timings.append(time.perf_counter() - started)
+
+        with patch("main.scrape_product", timed_scrape_product):
+            yield
+
+
+def run_benchmark(
+        pages: int = 5, per_page: int = 20, latency: float = 0.0, failure_rate: float = 0.0,
+        engine: str = "http", workers: int = 1, rps: float = 1000.0
+) -> dict:
+    """
+    Функция прогоняет обход каталога на локальном сайте StandInSite и возвращает показатели производительности.
+
+    Сначала отдельно замеряется обход страниц каталога (страниц в секунду), затем полный цикл main():
+    общее время и число товаров в секунду, 50-й и 95-й процентили времени обработки одного товара
+    и пиковый объем памяти процесса вместе с браузерами. Для engine="selenium" требуется установленный Firefox.
+    Число сохраненных товаров сравнивается с числом товаров на сайте: если часть товаров не собрана (например,
+    из-за ошибок при failure_rate > 0), complete равно False и показатели относятся к неполному каталогу.
+    """
+    timings: list = []
+    with StandInSite(pages=pages, per_page=per_page, latency=latency, failure_rate=failure_rate) as site, \
+            tempfile.TemporaryDirectory() as directory, \
+            patch("main.URL", site.listing_url), \
+            patch("main.CSV_PATH", os.path.join(directory, "products.csv")), \
+            patch("main.PARQUET_PATH", os.path.join(directory, "products.parquet")), \
+            patch("main.STATE_PATH", os.path.join(directory, "crawl_state.sqlite3")), \
+            contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        if engine == "http":
+            main.get_all_products_urls_http(start_page=1, limiter=main.RateLimiter(max_rate=rps))
+        else:
+            driver = main.create_driver(lean=True)
+            try:
+                main.get_all_products_urls(start_page=1, driver=driver,
+                                           limiter=main.RateLimiter(max_rate=rps, workers=workers))
+            finally:
+                driver.quit()
+        listing_seconds = time.perf_counter() - started
+
+        with MemorySampler() as memory, record_product_timings(engine, timings):
+            started = time.perf_counter()
+            main.main(workers=workers, engine=engine, rps=rps, http_rps=rps, lean=True)
+            total_seconds = time.perf_counter() - started
+
+        with open(main.CSV_PATH, encoding="utf-8") as file:
+            products = sum(1 for _line in file) - 1
+
+    expected_products = pages * per_page
+    return {
+        "engine": engine,
+        "workers": workers,
+        "expected_products": expected_products,
+        "products": products,
+        "complete": products == expected_products,
+        "total_seconds": total_seconds,
+        "listing_pages_per_second": pages / listing_seconds,
+        "products_per_second": products / total_seconds,
+        "product_p50_seconds": percentile(timings, 50),
+        "product_p95_seconds": percentile(timings, 95),
+        "peak_rss_mb": memory.peak / 2 ** 20,
+    }
+
+
+def make_raw_products(rows: int, seed: int = 0) -> list[dict]:
+    """
+    Функция формирует rows товаров в том виде, в каком их возвращает create_item_dict: цены и рейтинги строками
+    с лишними пробелами, около 10% цен со скидкой (новая и старая цена в одной строке), значения "Not available"
+    и около 5% повторов по ссылке.
+    """
+    rng = random.Random(seed)
+    items = []
+    for number in range(1, rows + 1):
+        product_id = rng.randint(1, int(rows * 0.95)) if number % 20 == 0 else number
+        missing = rng.random() < 0.1
+        price = "{:,} ₽".format(rng.randint(500, 40000)).replace(",", "\u00a0")
+        if rng.random() < 0.1:
+            price += " {:,} ₽".format(rng.randint(500, 40000)).replace(",", " ")
+        items.append(main.create_item_dict(
+            number=number,
+            link=f"https://goldapple.ru/{product_id}",
+            name=f"  Аромат\n{product_id} ",
+            price="Not available" if missing else price,
+            rating="Not available" if missing else round(rng.uniform(3, 5), 1),
+            description=f"Описание  товара\t{product_id}. " * rng.randint(1, 10),
+            instructions="Not available" if missing else "Нанести на кожу.",
+            country=rng.choice(["Франция", " Италия", "ОАЭ ", "Not available"]),
+        ))
+    return items
+
+
+def clean_rows(items: list[dict]) -> pd.DataFrame:
+    """
+    Построчная обработка товаров, которую заменяет main.clean_dataframe (эталон для сравнения в замере).
+
+    Правила те же: пробелы нормализуются, из цены берется первое число, повторы по ссылке отбрасываются.
+    """
+    rows = []
+    seen = set()
+    for item in items:
+        row = {key: None if value == "Not available" else value for key, value in item.items()}
+        for key in ("link", "name", "description", "instructions", "country"):
+            if row[key] is not None:
+                row[key] = " ".join(str(row[key]).split()) or None
+        if row["link"] is None or row["link"] in seen:
+            continue
+        seen.add(row["link"])
+        match = re.search(r"\d[\d ]*", " ".join(str(row["price"]).split())) if row["price"] is not None else None
+        price = int(match.group().replace(" ", "")) if match else None
+        row["price"] = price if price and price > 0 else None
+        rating = float(row["rating"]) if row["rating"] is not None else None
+        row["rating"] = rating if rating is not None and 0 <= rating <= 5 else None
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def benchmark_postprocessing(rows: int = 100_000) -> dict:
+    """
+    Функция сравнивает построчную обработку товаров (clean_rows) с векторной (main.clean_dataframe)
+    на rows товаров и возвращает время в секундах и объем памяти результата в мегабайтах.
+    """
+    items = make_raw_products(rows)
+    result: dict = {"rows": rows}
+    for name, clean in (("row_by_row", clean_rows), ("vectorized", lambda _items: main.clean_dataframe(
+            main.get_dataframe(_items)))):
+        started = time.perf_counter()
+        cleaned = clean(items)
+        result[name + "_seconds"] = time.perf_counter() - started
+        result[name + "_memory_mb"] = cleaned.memory_usage(deep=True).sum() / 2 ** 20
+        result[name + "_rows"] = len(cleaned)
+    return result
+
+
+def parse_args(argv: list | None = None) -> argparse.Namespace:
+    """Функция разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(description="Замер производительности парсера на локальном сайте.")
+    parser.add_argument("--pages", type=int, default=5, help="количество страниц каталога")
+    parser.add_argument("--per-page", type=int, default=20, help="количество товаров на странице каталога")
+    parser.add_argument("--latency", type=float, default=0.0, help="средняя задержка ответа сайта, с")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="доля запросов, завершающихся ошибкой 503")
+    parser.add_argument("--engine", choices=("selenium", "http"), default="http", help="способ загрузки страниц")
+    parser.add_argument("--workers", type=int, default=1, help="количество параллельных браузеров")
+    parser.add_argument("--postprocess", type=int, metavar="ROWS",
+                        help="вместо обхода сравнить построчную и векторную обработку ROWS товаров")
+    parser.add_argument("--json", metavar="PATH", help="сохранить результаты замера в JSON-файл")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.postprocess:
+        result = benchmark_postprocessing(args.postprocess)
+    else:
+        result = run_benchmark(pages=args.pages, per_page=args.per_page, latency=args.latency,
+                               failure_rate=args.failure_rate, engine=args.engine, workers=args.workers)
+    for key, value in result.items():
+        print("{}: {}".format(key, round(value, 3) if isinstance(value, float) else value))
+    if not result.get("complete", True):
+        print("Внимание: собрано {products} из {expected_products} товаров, показатели относятся "
+              "к неполному каталогу.".format(**result))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2)
@@ -0,0 +1,103 @@
+import json
+import sqlite3
+import threading
+
+STATE_PATH = "crawl_state.sqlite3"
+MAX_ATTEMPTS = 3
+
+
+class CrawlState:
+    """
+    Состояние обхода каталога в базе SQLite.
+
+    Хранит найденные на страницах каталога URL товаров с постоянными номерами, статус обработки каждого товара
+    (pending/done/failed), число попыток и собранные данные, поэтому после сбоя обход можно продолжить
+    с того места, где он остановился.
+    """
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS products (
+                number INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL UNIQUE,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                item TEXT
+            );
+        """)
+
+    def __enter__(self) -> "CrawlState":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Метод закрывает соединение с базой."""
+        self.connection.close()
+
+    def reset(self) -> None:
+        """Метод удаляет сохраненное состояние, чтобы начать обход заново."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM meta")
+            self.connection.execute("DELETE FROM products")
+            self.connection.execute("DELETE FROM sqlite_sequence WHERE name = 'products'")
+
+    def is_listing_complete(self) -> bool:
+        """Метод проверяет, был ли полностью обойден каталог."""
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'listing_complete'").fetchone()
+        return row is not None
+
+    def add_products(self, product_urls: list) -> None:
+        """Метод сохраняет найденные URL товаров и отмечает обход каталога завершенным."""
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO products (url) VALUES (?)",
+                                        ((_url,) for _url in product_urls))
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('listing_complete', '1')")
+
+    def pending_products(self, max_attempts: int = MAX_ATTEMPTS) -> list[tuple[int, str]]:
+        """Метод возвращает номера и URL товаров, которые еще не обработаны или завершились ошибкой."""
+        return self.connection.execute(
+            "SELECT number, url FROM products WHERE status != 'done' AND attempts < ? ORDER BY number",
+            (max_attempts,)
+        ).fetchall()
+
+    def mark_done(self, item: dict) -> None:
+        """Метод сохраняет собранный товар и отмечает его обработанным."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE products SET status = 'done', attempts = attempts + 1, error = NULL, item = ? WHERE url = ?",
+                (json.dumps(item, ensure_ascii=False), item["link"])
+            )
+
+    def mark_failed(self, url: str, error: Exception | str) -> None:
+        """Метод отмечает товар, который не удалось обработать, и увеличивает счетчик попыток."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE products SET status = 'failed', attempts = attempts + 1, error = ? WHERE url = ?",
+                (str(error).strip() or type(error).__name__, url)
+            )
+
+    def urls(self) -> list[str]:
+        """Метод возвращает URL всех найденных в каталоге товаров."""
+        return [_url for (_url,) in self.connection.execute("SELECT url FROM products ORDER BY number")]
+
+    def done_items(self):
+        """Метод последовательно возвращает собранные товары в порядке номеров."""
+        cursor = self.connection.execute("SELECT item FROM products WHERE status = 'done' ORDER BY number")
+        for (item,) in cursor:
+            yield json.loads(item)
+
+    def counts(self) -> dict[str, int]:
+        """Метод возвращает количество товаров в каждом статусе."""
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM products GROUP BY status").fetchall())
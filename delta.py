@@ -0,0 +1,86 @@
+import csv
+import hashlib
+import os
+
+CHANGES_PATH = "changes.csv"
+CONTENT_FIELDS = ("name", "price", "rating", "description", "instructions", "country")
+CHANGES_FIELDS = ("change", "link", "old_price") + CONTENT_FIELDS
+
+
+def item_hash(item: dict) -> bytes:
+    """
+    Функция вычисляет хеш содержимого товара (без номера и ссылки).
+
+    Значения приводятся к строкам, поэтому товар из create_item_dict и та же строка, прочитанная из CSV,
+    дают одинаковый хеш.
+    """
+    content = "\x1f".join(str(item.get(field, "")) for field in CONTENT_FIELDS)
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+
+
+class DeltaTracker:
+    """
+    Сравнение собранных товаров с предыдущей выгрузкой.
+
+    Предыдущая выгрузка previous_path загружается в индекс: ссылка -> (хеш содержимого, цена). Каждый новый товар
+    сравнивается с индексом по мере поступления, и в журнал изменений changes_path записываются только новые
+    товары (added), товары с изменившейся ценой (price_changed) или другими полями (text_changed), а при
+    завершении - товары, которых больше нет в каталоге (removed). Журнал пишется во временный файл
+    <changes_path>.part и переименовывается при успешном завершении блока with.
+    """
+
+    def __init__(self, previous_path: str, changes_path: str = CHANGES_PATH):
+        self.previous_path = previous_path
+        self.changes_path = changes_path
+        self.part_path = changes_path + ".part"
+        self.index: dict[str, tuple[bytes, str]] = {}
+        self.seen: set = set()
+        self.counts = {"added": 0, "removed": 0, "price_changed": 0, "text_changed": 0}
+        self.file = None
+        self.writer = None
+        if os.path.exists(previous_path):
+            with open(previous_path, encoding="utf-8", newline="") as file:
+                for row in csv.DictReader(file):
+                    self.index[row["link"]] = (item_hash(row), row.get("price", ""))
+
+    def __enter__(self) -> "DeltaTracker":
+        self.file = open(self.part_path, "w", encoding="utf-8", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=CHANGES_FIELDS, extrasaction="ignore")
+        self.writer.writeheader()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.part_path, self.changes_path)
+
+    def compare(self, item: dict) -> str | None:
+        """Метод сравнивает товар с предыдущей выгрузкой, записывает изменение в журнал и возвращает его тип."""
+        link = item["link"]
+        self.seen.add(link)
+        previous = self.index.get(link)
+        if previous is None:
+            change, old_price = "added", ""
+        elif previous[0] == item_hash(item):
+            return None
+        elif previous[1] != str(item.get("price", "")):
+            change, old_price = "price_changed", previous[1]
+        else:
+            change, old_price = "text_changed", previous[1]
+
+        self.writer.writerow({**item, "change": change, "old_price": old_price})
+        self.counts[change] += 1
+        return change
+
+    def finish(self, current_links) -> None:
+        """
+        Метод записывает в журнал товары предыдущей выгрузки, которых нет среди current_links.
+
+        current_links - все ссылки, найденные в каталоге при текущем обходе, поэтому товары, которые
+        не удалось обработать из-за ошибок, не считаются удаленными.
+        """
+        current_links = set(current_links) | self.seen
+        for link, (_digest, price) in self.index.items():
+            if link not in current_links:
+                self.writer.writerow({"change": "removed", "link": link, "old_price": price})
+                self.counts["removed"] += 1
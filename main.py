@@ -1,68 +1,279 @@
+import argparse
+import asyncio
+import contextlib
+import csv
+import functools
+import itertools
+import json
+import os
+import queue
+import re
+import socket
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urljoin, urlsplit
 
+import httpx
 import pandas as pd
+import psutil
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import urllib3
+from bs4 import BeautifulSoup
+from lxml import etree
+from lxml import html as lxml_html
 from selenium import webdriver as wd
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import InvalidSelectorException, NoSuchElementException, \
+    StaleElementReferenceException, TimeoutException, WebDriverException
+
+from checkpoint import STATE_PATH, CrawlState
+from delta import CHANGES_PATH, DeltaTracker
+from metrics import METRICS, METRICS_INTERVAL, MetricsExporter
+from page_cache import CACHE_DIR, PageCache
+from rate_limiter import REQUESTS_PER_SECOND, RateLimiter
+from work_queue import QUEUE_URL, VISIBILITY_TIMEOUT, Task, WorkQueue, open_queue
 
 URL = "https://goldapple.ru/parfjumerija"
 CSV_PATH = "products.csv"
+PARQUET_PATH = "products.parquet"
+SELECTORS_PATH = "selectors.json"
+PAGE_TIMEOUT = 10
+LISTING_ATTEMPTS = 3
+DRIVER_MAX_PAGES = 500
+DRIVER_MAX_RSS_MB = 1500
+HTTP_CONCURRENCY = 50
+# Частота запросов HTTP-клиента (--engine http) для всех одновременных запросов; браузеры ограничиваются --rps
+HTTP_REQUESTS_PER_SECOND = 5.0
+HTTP_CHUNK_SIZE = 500
+HTTP_TIMEOUT = 30
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:120.0) Gecko/20100101 Firefox/120.0",
+    "Accept-Language": "ru-RU,ru;q=0.9",
+}
+
+# Селекторы, которые необходимо проверять перед запуском (см. "Нюансы работы" в README).
+# Функции разбора читают их из SELECTORS при каждом вызове, поэтому load_selectors достаточно изменить словарь
+DEFAULT_SELECTORS = {
+    "ITEMS_CLASS": "Wqob-",
+    "NAME_XPATH": '//*[@id="__layout"]/div/main/article/div[4]/div[2]/div/div[2]/div[1]/div/div/div/div[1]',
+    "PRICE_XPATH": '//*[@id="__layout"]/div/main/article/div[1]/div[1]/form/div[2]/div[1]/div[1]/div[1]',
+    "RATING_XPATH": '//*[@id="__layout"]/div/main/div[1]/div/div[3]/a[1]/div/div[1]',
+    "MENU_BUTTON_XPATH": '//*[@id="__layout"]/div/main/article/div[4]/div[2]/div/div[1]/div[1]/div/button[{}]',
+    "DESCRIPTION_CLASS": "G5-4J",
+    "COUNTRY_CLASS": "G4xy5",
+}
+SELECTORS = dict(DEFAULT_SELECTORS)
+PREFLIGHT_THRESHOLD = 0.5
+
+# Поочередно открывает вкладки описания товара и возвращает HTML страницы после нажатия на каждую из них
+TABS_SCRIPT = """
+const [buttonXpath, done] = arguments;
+const find = (xpath) => document.evaluate(
+    xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+
+(async () => {
+    const tabs = [];
+    for (let i = 1; i <= 4; i++) {
+        const button = find(buttonXpath.replace("{}", i));
+        if (!button) {
+            tabs.push(null);
+            continue;
+        }
+        button.click();
+        await new Promise((resolve) => setTimeout(resolve, 0));
+        tabs.push(document.documentElement.outerHTML);
+    }
+    return tabs;
+})().then(done, () => done([]));
+"""
+
+# Открывает все вкладки описания товара за один вызов драйвера и возвращает содержимое
+# вкладок <Применение> и <О бренде> в виде объекта {"ПРИМЕНЕНИЕ": ..., "О БРЕНДЕ": ...}
+MENU_SCRIPT = """
+const [buttonXpath, descriptionClass, countryClass, done] = arguments;
+const classes = {"ПРИМЕНЕНИЕ": descriptionClass, "О БРЕНДЕ": countryClass};
+const contents = {};
+const find = (xpath) => document.evaluate(
+    xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+
+(async () => {
+    for (let i = 1; i <= 4; i++) {
+        const button = find(buttonXpath.replace("{}", i));
+        if (!button) continue;
+        button.click();
+        await new Promise((resolve) => setTimeout(resolve, 0));
+        const label = find(buttonXpath.replace("{}", i) + "/div");
+        if (!label) continue;
+        const title = label.innerText.trim();
+        const block = classes[title] && document.getElementsByClassName(classes[title])[0];
+        if (block) contents[title] = block.innerText;
+    }
+    return contents;
+})().then(done, () => done(contents));
+"""
+
+# Возвращает JSON-строку с состоянием Nuxt, встроенным в страницу при серверном рендеринге, и ссылками
+# из карточек товаров (класс карточек - arguments[0])
+STATE_SCRIPT = """
+const links = Array.from(document.getElementsByClassName(arguments[0]), (item) => item.querySelector("article a"))
+    .filter((link) => link && link.href)
+    .map((link) => link.href);
+return JSON.stringify({state: window.__NUXT__ || null, links: links});
+"""
+# Ключи, по которым в состоянии Nuxt ищутся поля товаров (см. find_state_products)
+STATE_LINK_KEYS = ("url", "link", "href", "slug")
+STATE_NAME_KEYS = ("name", "title")
+STATE_PRICE_KEYS = ("price", "actualPrice", "regularPrice")
+STATE_RATING_KEYS = ("rating", "reviewsRating")
+DETAIL_FIELDS = ("description", "instructions", "country")
 
 opts = wd.FirefoxOptions()
 opts.add_argument("--width=1200")
 opts.add_argument("--height=720")
 
+# Домены аналитики и рекламы, запросы к которым блокируются в облегченном профиле браузера
+BLOCKED_HOSTS = [
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "mc.yandex.ru", "an.yandex.ru",
+    "top-fwz1.mail.ru", "vk.com", "facebook.net", "criteo.com", "criteo.net", "mindbox.ru", "flocktory.com",
+    "digitaltarget.ru", "tiktok.com", "hotjar.com",
+]
+
 
 # ====================================================================================
 
-def main() -> None:
-    """Основная функция, которая выполняет сбор данных о продуктах, их обработку и сохранение в CSV-файл."""
+def main(
+        workers: int = 1, engine: str = "selenium", snapshot: bool = False, menu_script: bool = False,
+        resume: bool = False, rps: float = REQUESTS_PER_SECOND, lean: bool = False,
+        max_pages: int | None = DRIVER_MAX_PAGES, max_rss_mb: float | None = DRIVER_MAX_RSS_MB,
+        output: str = "csv", cache: bool = False, metrics: str | None = None, metrics_format: str = "jsonl",
+        metrics_interval: float = METRICS_INTERVAL, delta: bool = False, listing: bool = False,
+        preflight: bool = False, preflight_threshold: float = PREFLIGHT_THRESHOLD,
+        http_rps: float = HTTP_REQUESTS_PER_SECOND
+) -> None:
+    """
+    Основная функция, которая выполняет сбор данных о продуктах, их обработку и сохранение в CSV-файл.
 
-    firefox_driver = wd.Firefox(options=opts)
+    Ход обхода сохраняется в STATE_PATH. При resume=True уже обработанные товары пропускаются,
+    а товары, завершившиеся ошибкой, обрабатываются повторно. Частота запросов к сайту не превышает
+    rps запросов в секунду на каждый из workers браузеров; HTTP-клиент (engine="http") ограничивается отдельно
+    частотой http_rps для всех одновременных запросов. При lean=True браузеры запускаются с облегченным
+    профилем (create_lean_options).
+    Каждый браузер перезапускается через max_pages страниц или при превышении max_rss_mb памяти (ManagedDriver).
+    output задает формат выгрузки: "csv", "parquet" (с приведенными типами полей) или "both".
+    При cache=True загруженные страницы товаров сохраняются в CACHE_DIR для повторного разбора (replay).
+    Если указан metrics, время этапов обработки и счетчики каждые metrics_interval секунд выгружаются
+    в этот файл в формате metrics_format ("jsonl" или "prometheus").
+    При delta=True собранные товары сравниваются с предыдущей выгрузкой CSV_PATH, и в CHANGES_PATH
+    записываются только новые, удаленные и изменившиеся товары (DeltaTracker).
+    При listing=True название, цена и рейтинг берутся из состояния страниц каталога (get_all_listing_items),
+    а описание - из предыдущей выгрузки; открываются только товары, для которых описания нет.
+    При preflight=True перед обходом селекторы проверяются на нескольких страницах (run_preflight), и работа
+    прерывается, если какое-либо поле находится реже, чем на доле preflight_threshold страниц.
+    """
+    limiter = RateLimiter(max_rate=rps, workers=workers)
+    http_limiter = RateLimiter(max_rate=http_rps)
+    complete_items: list = []
+    driver_factory = functools.partial(ManagedDriver, functools.partial(create_driver, lean=lean),
+                                       max_pages=max_pages, max_rss_mb=max_rss_mb)
 
-    print("Загрузка данных...")
-    product_urls = get_all_products_urls(start_page=1, end_page=414, driver=firefox_driver)
-    print("Готово! Получено {} товаров.".format(len(product_urls)))
+    if preflight:
+        check_preflight(run_preflight(workers=workers, driver_factory=driver_factory, limiter=limiter),
+                        preflight_threshold)
 
-    # product_urls = ["https://goldapple.ru/26830400003-dreaming-with-ghosts",
-    #                 "https://goldapple.ru/7430500002-eau-fraiche",
-    #                 "https://goldapple.ru/19000225097"
-    #                 ]
+    exporter = MetricsExporter(metrics, metrics_format, metrics_interval) if metrics else contextlib.nullcontext()
+    with exporter, CrawlState(STATE_PATH) as state, \
+            (PageCache(CACHE_DIR) if cache else contextlib.nullcontext()) as page_cache:
+        if not resume:
+            state.reset()
 
-    print("Обработка данных...")
-    items_list: list[dict] = []
-    item_number = 0
-    for _url in product_urls:
-        make_selenium_get_request(_url, firefox_driver)
+        if state.is_listing_complete():
+            print("Список товаров загружен из {}.".format(STATE_PATH))
+        else:
+            print("Загрузка данных...")
+            if listing:
+                firefox_driver = driver_factory()
+                listing_items = get_all_listing_items(start_page=1, driver=firefox_driver, limiter=limiter)
+                firefox_driver.quit()
+                product_urls = [item["link"] for item in listing_items]
+            elif engine == "http":
+                product_urls = get_all_products_urls_http(start_page=1, limiter=http_limiter)
+            elif workers > 1:
+                product_urls = get_all_products_urls_parallel(workers=workers, start_page=1, limiter=limiter,
+                                                              driver_factory=driver_factory)
+            else:
+                firefox_driver = driver_factory()
+                product_urls = get_all_products_urls(start_page=1, driver=firefox_driver, limiter=limiter)
+                firefox_driver.quit()
+            print("Готово! Получено {} товаров.".format(len(product_urls)))
+
+            # product_urls = ["https://goldapple.ru/26830400003-dreaming-with-ghosts",
+            #                 "https://goldapple.ru/7430500002-eau-fraiche",
+            #                 "https://goldapple.ru/19000225097"
+            #                 ]
+
+            state.add_products(product_urls)
+            if listing:
+                numbers = {_url: number for number, _url in state.pending_products()}
+                complete_items = complete_listing_items(listing_items, load_previous_details(CSV_PATH), numbers)
+                for item in complete_items:
+                    state.mark_done(item)
+                print("Товаров, собранных со страниц каталога: {}".format(len(complete_items)))
 
-        time.sleep(1.5)
+        pending_products = state.pending_products()
+        numbers = [number for number, _url in pending_products]
+        product_urls = [_url for number, _url in pending_products]
 
-        item_number: int = item_number + 1
-        item_name: str = get_item_name(driver=firefox_driver)
-        item_price: str = get_item_price(driver=firefox_driver)
-        item_rating: float | str = get_item_rating(driver=firefox_driver)
-        item_description: str = get_item_description(driver=firefox_driver)
-        item_instructions, item_country = manipulate_menu(driver=firefox_driver)
+        print("Обработка данных... Осталось товаров: {}".format(len(product_urls)))
+        # Предыдущая выгрузка читается до того, как StreamingCsvWriter заменит ее новой. При продолжении обхода
+        # товары записываются из CrawlState.done_items уже по порядку, но с пропусками на месте товаров с ошибкой
+        with StreamingCsvWriter(CSV_PATH, ordered=not resume) as writer, \
+                (DeltaTracker(CSV_PATH, CHANGES_PATH) if delta else contextlib.nullcontext()) as tracker:
+            def write(item: dict) -> None:
+                writer.write(item)
+                if tracker is not None and tracker.compare(item):
+                    METRICS.inc("scraper_changes_total")
 
-        items_list.append(create_item_dict(
-            number=item_number,
-            link=_url,
-            name=item_name,
-            price=item_price,
-            rating=item_rating,
-            description=item_description,
-            instructions=item_instructions,
-            country=item_country
-        ))
+            def on_item(item: dict) -> None:
+                METRICS.inc("scraper_products_total", status="done")
+                state.mark_done(item)
+                if not resume:
+                    write(item)
 
-        print("Товар {} создан!".format(item_name))
+            def on_failure(number: int, _url: str, error: Exception) -> None:
+                print("Ошибка при обработке {}: {}".format(_url, error))
+                METRICS.inc("scraper_products_total", status="failed")
+                state.mark_failed(_url, error)
+                if not resume:
+                    writer.skip(number)
 
-    print("Все товары были созданы. Процесс сохранения...")
-    items_dataframe = get_dataframe(items_list)
-    save_to_csv(items_dataframe, CSV_PATH)
-    print("Все товары сохранены в {}".format(CSV_PATH))
+            if not resume:
+                for item in complete_items:
+                    write(item)
+            if engine == "http":
+                scrape_products_http(product_urls, limiter=http_limiter, browser_limiter=limiter,
+                                     driver_factory=driver_factory, workers=workers, numbers=numbers,
+                                     on_item=on_item, on_failure=on_failure, cache=page_cache)
+            else:
+                scrape_products_parallel(product_urls, workers=workers, limiter=limiter,
+                                         driver_factory=driver_factory, snapshot=snapshot,
+                                         menu_script=menu_script, numbers=numbers, on_item=on_item,
+                                         on_failure=on_failure, cache=page_cache)
 
-    firefox_driver.close()
+            if resume:
+                for item in state.done_items():
+                    write(item)
+            if tracker is not None:
+                tracker.finish(state.urls())
+                print("Изменения относительно предыдущей выгрузки сохранены в {}: {}".format(
+                    CHANGES_PATH, tracker.counts))
+            print("Все товары были созданы. Процесс сохранения...")
+
+        print("Все товары сохранены в {}. Статус обработки: {}".format(export_output(output), state.counts()))
 
 
 # ====================================================================================
@@ -77,7 +288,7 @@ def make_selenium_get_request(url: str, driver, page: int | None = None) -> None
 
 
 def get_items_class(driver):
-    children = driver.find_elements(By.CLASS_NAME, "Wqob-")
+    children = driver.find_elements(By.CLASS_NAME, SELECTORS["ITEMS_CLASS"])
     print(f"Это внутри: {children}")
     return children
 
@@ -93,62 +304,640 @@ def get_items_urls_on_page(tablet_items_class_content) -> list:
     return product_urls
 
 
-def get_all_products_urls(driver, start_page: int = 1, end_page: int = 1) -> list:
-    """Функция получает список URL-адресов продуктов с веб-страницы магазина."""
-    product_urls: list = []
-    for page in range(start_page, end_page + 1):
-        make_selenium_get_request(URL, driver, page)
-        tablet_items_class = get_items_class(driver)
-        product_urls += get_items_urls_on_page(tablet_items_class)
-        print(f"Страница {page} обработана.")
-        time.sleep(2)
-    return product_urls
+def wait_for_element(driver, locator: tuple, timeout: float = PAGE_TIMEOUT) -> bool:
+    """Функция ожидает появления элемента locator на странице и возвращает False, если он не появился."""
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.1).until(EC.presence_of_element_located(locator))
+        return True
+    except TimeoutException:
+        return False
+
+
+def open_page(url: str, driver, locator: tuple, limiter: RateLimiter | None = None, page: int | None = None) -> bool:
+    """
+    Функция открывает страницу и ожидает появления на ней элемента locator.
+
+    Если передан limiter, запрос выполняется только после его разрешения, а время ответа и то, появился ли
+    элемент, передаются обратно в limiter для подстройки скорости.
+    """
+    if limiter:
+        with METRICS.timer("scraper_stage_seconds", stage="rate_limit_wait"):
+            limiter.acquire()
+    started = time.perf_counter()
+    with METRICS.timer("scraper_stage_seconds", stage="driver_get"):
+        make_selenium_get_request(url, driver, page)
+    with METRICS.timer("scraper_stage_seconds", stage="wait_for_element"):
+        ready = wait_for_element(driver, locator)
+    if not ready:
+        METRICS.inc("scraper_page_timeouts_total")
+    if limiter:
+        limiter.record(time.perf_counter() - started, ok=ready)
+    return ready
+
+
+def is_page_rendered(driver) -> bool:
+    """Функция проверяет, что сайт отрисовал страницу (есть корневой элемент #__layout), а не вернул ошибку."""
+    return bool(driver.find_elements(By.ID, "__layout"))
+
+
+def open_listing_page(driver, page: int, limiter: RateLimiter | None = None, url: str | None = None) -> bool:
+    """
+    Функция открывает страницу каталога с номером page и возвращает False, если страница загрузилась,
+    но товаров на ней нет (конец каталога).
+
+    Страница, которая не загрузилась (ошибка сайта или тайм-аут), открывается повторно; после LISTING_ATTEMPTS
+    попыток выбрасывается TimeoutException, чтобы сбой не принимался за конец каталога.
+    """
+    for attempt in range(1, LISTING_ATTEMPTS + 1):
+        if open_page(url or URL, driver, (By.CLASS_NAME, SELECTORS["ITEMS_CLASS"]), limiter, page):
+            return True
+        if is_page_rendered(driver):
+            return False
+        print("Страница {} не загрузилась (попытка {} из {}).".format(page, attempt, LISTING_ATTEMPTS))
+    raise TimeoutException("Страница каталога {} не загрузилась за {} попыток".format(page, LISTING_ATTEMPTS))
+
+
+def get_page_products_urls(driver, page: int, limiter: RateLimiter | None = None, url: str | None = None) -> list:
+    """
+    Функция открывает страницу каталога с номером page и возвращает URL-адреса товаров на ней.
+
+    url задает категорию каталога (по умолчанию - URL). Если страницу не удалось загрузить,
+    выбрасывается TimeoutException (см. open_listing_page).
+    """
+    open_listing_page(driver, page, limiter, url)
+    tablet_items_class = get_items_class(driver)
+    page_urls = get_items_urls_on_page(tablet_items_class)
+    print(f"Страница {page} обработана.")
+    return page_urls
+
+
+def find_last_page(has_items, start_page: int = 1) -> int:
+    """
+    Функция находит номер последней непустой страницы каталога.
+
+    has_items(page) проверяет, есть ли товары на странице. Сначала номер страницы удваивается до первой
+    пустой страницы, затем граница уточняется двоичным поиском, поэтому для 400 страниц требуется
+    около 18 запросов. Если пуста уже start_page, возвращается start_page - 1.
+    """
+    if not has_items(start_page):
+        return start_page - 1
+
+    low, step = start_page, 1
+    while has_items(start_page + step):
+        low = start_page + step
+        step *= 2
+    high = start_page + step
+
+    while high - low > 1:
+        middle = (low + high) // 2
+        if has_items(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def merge_pages_urls(pages_urls) -> list:
+    """
+    Функция объединяет URL-адреса товаров со страниц каталога без повторов, сохраняя порядок.
+
+    Обработка останавливается на первой пустой странице.
+    """
+    product_urls: dict = {}
+    for page_urls in pages_urls:
+        if not page_urls:
+            break
+        product_urls.update(dict.fromkeys(page_urls))
+    return list(product_urls)
+
+
+def get_all_products_urls(
+        driver, start_page: int = 1, end_page: int | None = None, limiter: RateLimiter | None = None
+) -> list:
+    """
+    Функция получает список URL-адресов продуктов с веб-страницы магазина.
+
+    Если end_page не указан, страницы обходятся до первой пустой. Повторяющиеся URL отбрасываются.
+    """
+    def pages_urls():
+        page = start_page
+        while end_page is None or page <= end_page:
+            yield get_page_products_urls(driver, page, limiter)
+            page += 1
+
+    return merge_pages_urls(pages_urls())
+
+
+def get_all_products_urls_parallel(
+        workers: int = 2, start_page: int = 1, end_page: int | None = None, limiter: RateLimiter | None = None,
+        driver_factory=None
+) -> list:
+    """
+    Функция получает список URL-адресов продуктов, загружая страницы каталога пулом браузеров.
+
+    Если end_page не указан, номер последней страницы определяется через find_last_page; уже загруженные
+    при поиске страницы повторно не запрашиваются.
+    """
+    driver_factory = driver_factory or create_driver
+    pages_urls: dict = {}
+
+    if end_page is None:
+        driver = driver_factory()
+        try:
+            def has_items(page: int) -> bool:
+                pages_urls[page] = get_page_products_urls(driver, page, limiter)
+                return bool(pages_urls[page])
+
+            end_page = find_last_page(has_items, start_page)
+        finally:
+            driver.quit()
+        print(f"Найдено страниц: {end_page - start_page + 1}.")
+
+    pages = [page for page in range(start_page, end_page + 1) if page not in pages_urls]
+    fetched = run_driver_pool(pages, lambda driver, page: get_page_products_urls(driver, page, limiter),
+                              workers=workers, driver_factory=driver_factory)
+    pages_urls.update(zip(pages, fetched))
+
+    return merge_pages_urls(pages_urls[page] for page in range(start_page, end_page + 1))
+
+
+def first_value(data: dict, keys: tuple):
+    """Функция возвращает значение первого из ключей keys, который есть в data, или None."""
+    for key in keys:
+        if data.get(key) not in (None, ""):
+            return data[key]
+    return None
+
+
+def format_state_price(price) -> str | None:
+    """Функция приводит цену из состояния Nuxt (число, строка или объект с amount/value) к виду "12 345 ₽"."""
+    if isinstance(price, dict):
+        price = first_value(price, ("amount", "value") + STATE_PRICE_KEYS)
+    if price is None or isinstance(price, (bool, dict, list)):
+        return None
+    if isinstance(price, (int, float)):
+        return "{:,}".format(round(price)).replace(",", " ") + " ₽"
+    return str(price).strip()
+
+
+def find_state_products(state, base_url: str = URL) -> list[dict]:
+    """
+    Функция находит в состоянии Nuxt объекты, похожие на товары, и возвращает их поля без повторов.
+
+    Товаром считается объект, у которого есть ссылка, название и цена (ключи STATE_*_KEYS). Поля описания
+    (DETAIL_FIELDS) берутся, если они есть в том же объекте.
+    """
+    products: dict = {}
+    stack = [state]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+            continue
+        if not isinstance(node, dict):
+            continue
+
+        link, name = first_value(node, STATE_LINK_KEYS), first_value(node, STATE_NAME_KEYS)
+        price = format_state_price(first_value(node, STATE_PRICE_KEYS))
+        if isinstance(link, str) and isinstance(name, str) and price is not None:
+            rating = first_value(node, STATE_RATING_KEYS)
+            item = {"link": urljoin(base_url, link), "name": name.strip(), "price": price,
+                    "rating": float(rating) if isinstance(rating, (int, float)) else "Not available"}
+            item.update({field: node[field] for field in DETAIL_FIELDS if isinstance(node.get(field), str)})
+            products.setdefault(item["link"], item)
+            continue
+        stack.extend(reversed(list(node.values())))
+    return list(products.values())
+
+
+def get_page_listing_items(driver, page: int, limiter: RateLimiter | None = None) -> list[dict]:
+    """
+    Функция открывает страницу каталога и извлекает товары из встроенного состояния Nuxt одним вызовом драйвера.
+
+    Из состояния берутся только товары, ссылки на которые есть в карточках страницы: товары из рекомендаций
+    и рекламных блоков в состоянии к каталогу не относятся. Если состояния на странице нет, возвращаются только
+    ссылки из карточек. Для страницы без карточек (конец каталога) возвращается пустой список.
+    """
+    if not open_listing_page(driver, page, limiter):
+        return []
+    page_data = json.loads(driver.execute_script(STATE_SCRIPT, SELECTORS["ITEMS_CLASS"]))
+    # Ссылки сравниваются по пути: в карточках они абсолютные, а в состоянии - относительные
+    tile_paths = {urlsplit(_url).path for _url in page_data["links"]}
+    items = [item for item in find_state_products(page_data["state"], URL)
+             if urlsplit(item["link"]).path in tile_paths] if page_data["state"] else []
+    if not items:
+        items = [{"link": _url} for _url in page_data["links"]]
+    print(f"Страница {page} обработана.")
+    return items
+
+
+def get_all_listing_items(
+        driver, start_page: int = 1, end_page: int | None = None, limiter: RateLimiter | None = None
+) -> list[dict]:
+    """Функция собирает товары со страниц каталога до первой пустой (см. get_page_listing_items) без повторов."""
+    items: dict = {}
+    page = start_page
+    while end_page is None or page <= end_page:
+        page_items = get_page_listing_items(driver, page, limiter)
+        if not page_items:
+            break
+        for item in page_items:
+            items.setdefault(item["link"], item)
+        page += 1
+    return list(items.values())
+
+
+def load_previous_details(path: str = CSV_PATH) -> dict[str, dict]:
+    """Функция загружает из предыдущей выгрузки поля описания товаров (DETAIL_FIELDS) по ссылкам."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8", newline="") as file:
+        return {row["link"]: {field: row[field] for field in DETAIL_FIELDS if row.get(field)}
+                for row in csv.DictReader(file)}
+
+
+def complete_listing_items(listing_items: list[dict], previous: dict[str, dict], numbers: dict[str, int]) -> list:
+    """
+    Функция дополняет товары из каталога полями описания из предыдущей выгрузки previous.
+
+    Возвращает товары, у которых есть все поля, в виде create_item_dict с номерами numbers; остальные товары
+    нужно открыть в браузере.
+    """
+    complete = []
+    for item in listing_items:
+        fields = {**previous.get(item["link"], {}), **item}
+        if "name" in fields and "price" in fields and all(field in fields for field in DETAIL_FIELDS):
+            complete.append(create_item_dict(
+                number=numbers[item["link"]], link=item["link"], name=fields["name"], price=fields["price"],
+                rating=fields.get("rating", "Not available"), description=fields["description"],
+                instructions=fields["instructions"], country=fields["country"]
+            ))
+    return complete
 
 
 # ====================================================================================
 
+def create_lean_options(blocked_hosts: list | None = None) -> wd.FirefoxOptions:
+    """
+    Функция создает облегченный профиль браузера Firefox.
+
+    Браузер запускается без окна, страница считается загруженной после построения DOM (pageLoadStrategy=eager),
+    изображения, видео и загружаемые шрифты отключены, а запросы к доменам из blocked_hosts
+    направляются через PAC-скрипт на несуществующий прокси и не выполняются.
+    """
+    blocked_hosts = BLOCKED_HOSTS if blocked_hosts is None else blocked_hosts
+
+    lean_opts = wd.FirefoxOptions()
+    lean_opts.add_argument("--width=1200")
+    lean_opts.add_argument("--height=720")
+    lean_opts.add_argument("-headless")
+    lean_opts.page_load_strategy = "eager"
+
+    lean_opts.set_preference("permissions.default.image", 2)
+    lean_opts.set_preference("media.autoplay.default", 5)
+    lean_opts.set_preference("media.mediasource.enabled", False)
+    lean_opts.set_preference("media.hls.enabled", False)
+    lean_opts.set_preference("gfx.downloadable_fonts.enabled", False)
+    lean_opts.set_preference("browser.display.use_document_fonts", 0)
+
+    if blocked_hosts:
+        pac_script = (
+            "function FindProxyForURL(url, host) {"
+            f" var blocked = {json.dumps(blocked_hosts)};"
+            " for (var i = 0; i < blocked.length; i++) {"
+            "  if (host == blocked[i] || dnsDomainIs(host, '.' + blocked[i])) return 'PROXY 127.0.0.1:9';"
+            " }"
+            " return 'DIRECT'; }"
+        )
+        lean_opts.set_preference("network.proxy.type", 2)
+        lean_opts.set_preference("network.proxy.autoconfig_url", "data:text/javascript," + quote(pac_script))
+    return lean_opts
+
+
+def create_driver(lean: bool = False):
+    """Функция создает экземпляр браузера Firefox с настройками из opts или облегченным профилем."""
+    return wd.Firefox(options=create_lean_options() if lean else opts)
+
+
+class ManagedDriver:
+    """
+    Обертка над драйвером Firefox, которая не дает браузеру разрастаться при длительном обходе.
+
+    Браузер перезапускается каждые max_pages открытых страниц, а также когда память его процессов превышает
+    max_rss_mb (проверяется каждые rss_check_every страниц). Если сессия браузера завершилась, браузер
+    пересоздается, последняя запрошенная страница открывается заново, а неудавшийся вызов повторяется.
+    Остальные атрибуты и методы передаются текущему драйверу.
+    """
+
+    errors = (WebDriverException, urllib3.exceptions.HTTPError, ConnectionError)
+    # Ошибки, которые возвращает работающая сессия: проверять, жив ли браузер, после них не нужно
+    page_errors = (NoSuchElementException, TimeoutException, StaleElementReferenceException)
+
+    def __init__(
+            self, driver_factory=create_driver, max_pages: int | None = DRIVER_MAX_PAGES,
+            max_rss_mb: float | None = DRIVER_MAX_RSS_MB, rss_check_every: int = 10
+    ):
+        self.driver_factory = driver_factory
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.rss_check_every = rss_check_every
+        self.driver = driver_factory()
+        self.pages = 0
+        self.restarts = 0
+        self.last_url: str | None = None
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.driver, name)
+        if not callable(attribute):
+            return attribute
+        return lambda *args, **kwargs: self.call(lambda driver: getattr(driver, name)(*args, **kwargs))
+
+    @property
+    def page_source(self) -> str:
+        return self.call(lambda driver: driver.page_source)
+
+    def get(self, url: str) -> None:
+        """Метод открывает страницу, предварительно перезапуская браузер, если достигнуты ограничения."""
+        if self.needs_restart():
+            self.restart()
+        self.last_url = url
+        # Повтор вызова сам открывает страницу, поэтому открывать ее заново после перезапуска не нужно
+        self.call(lambda driver: driver.get(url), reload=False)
+        self.pages += 1
+
+    def call(self, command, reload: bool = True):
+        """
+        Метод выполняет command(driver) и при завершившейся сессии повторяет его в новом браузере.
+
+        Перед повтором в новом браузере открывается последняя запрошенная страница; при reload=False (повтор
+        самой навигации) - нет.
+        """
+        try:
+            return command(self.driver)
+        except self.page_errors:
+            raise
+        except self.errors:
+            if self.is_alive():
+                raise
+        print("Сессия браузера завершилась, перезапуск...")
+        self.restart()
+        if reload and self.last_url is not None:
+            self.driver.get(self.last_url)
+        return command(self.driver)
+
+    def is_alive(self) -> bool:
+        """Метод проверяет, отвечает ли сессия браузера."""
+        try:
+            self.driver.current_url
+            return True
+        except self.errors:
+            return False
+
+    def needs_restart(self) -> bool:
+        """Метод проверяет, пора ли перезапустить браузер по числу страниц или объему памяти."""
+        if self.max_pages and self.pages >= self.max_pages:
+            return True
+        if self.max_rss_mb and self.pages and self.pages % self.rss_check_every == 0:
+            return get_browser_rss(self.driver) > self.max_rss_mb * 2 ** 20
+        return False
+
+    def restart(self) -> None:
+        """Метод закрывает текущий браузер и запускает новый."""
+        try:
+            self.driver.quit()
+        except self.errors:
+            pass
+        self.driver = self.driver_factory()
+        self.pages = 0
+        self.restarts += 1
+        METRICS.inc("scraper_driver_restarts_total")
+
+
+def get_browser_rss(driver) -> int:
+    """Функция возвращает суммарный объем памяти (RSS) всех процессов браузера в байтах."""
+    pid = driver.capabilities.get("moz:processID")
+    if pid is None:
+        return 0
+    try:
+        process = psutil.Process(pid)
+        processes = [process] + process.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return 0
+
+    rss = 0
+    for browser_process in processes:
+        try:
+            rss += browser_process.memory_info().rss
+        except psutil.NoSuchProcess:
+            continue
+    return rss
+
+
+def benchmark_profiles(product_urls: list, driver_factory=create_driver, limiter: RateLimiter | None = None) -> dict:
+    """
+    Функция сравнивает обычный и облегченный профили браузера на одних и тех же товарах.
+
+    Для каждого профиля возвращает среднее время открытия страницы в секундах и пиковый объем памяти
+    процессов браузера в мегабайтах. Ожидание limiter в замер не входит.
+    """
+    result: dict = {}
+    for name, lean in (("default", False), ("lean", True)):
+        driver = driver_factory(lean=lean)
+        timings: list = []
+        peak_rss = 0
+        try:
+            for _url in product_urls:
+                if limiter:
+                    limiter.acquire()
+                started = time.perf_counter()
+                open_page(_url, driver, (By.XPATH, SELECTORS["NAME_XPATH"]))
+                timings.append(time.perf_counter() - started)
+                peak_rss = max(peak_rss, get_browser_rss(driver))
+        finally:
+            driver.quit()
+
+        result[name] = {"seconds_per_page": sum(timings) / len(timings), "peak_rss_mb": peak_rss / 2 ** 20}
+        print("{}: {:.2f} с на страницу, до {:.0f} МБ памяти".format(
+            name, result[name]["seconds_per_page"], result[name]["peak_rss_mb"]))
+    return result
+
+
+@METRICS.timed("scraper_stage_seconds", stage="scrape_product")
+def scrape_product(
+        url: str, driver, number: int, limiter: RateLimiter | None = None, snapshot: bool = False,
+        menu_script: bool = False, cache: PageCache | None = None
+) -> dict:
+    """
+    Функция открывает страницу товара, дожидается появления названия и собирает все поля товара в словарь.
+
+    При snapshot=True название, цена, рейтинг и описание извлекаются из одного снимка page_source
+    вместо отдельного запроса к драйверу на каждое поле. При menu_script=True вкладки описания
+    открываются одним скриптом в браузере (manipulate_menu_script). Если передан cache, страница
+    и содержимое каждой ее вкладки сохраняются в кеш для повторного разбора без браузера (replay).
+    """
+    open_page(url, driver, (By.XPATH, SELECTORS["NAME_XPATH"]), limiter)
+
+    page_source = driver.page_source if snapshot or cache is not None else None
+    item = extract_product(driver, url, number, snapshot=snapshot, menu_script=menu_script, page_source=page_source)
+    if cache is not None:
+        cache_page(cache, url, page_source, capture_tabs(driver))
+
+    print("Товар {} создан!".format(item["name"]))
+    return item
+
+
+def extract_product(
+        driver, url: str, number: int, snapshot: bool = False, menu_script: bool = False,
+        page_source: str | None = None
+) -> dict:
+    """Функция собирает поля товара с уже открытой страницы в словарь (см. scrape_product)."""
+    if snapshot:
+        fields = extract_item_fields(page_source if page_source is not None else driver.page_source)
+        item_name, item_price = fields["name"], fields["price"]
+        item_rating, item_description = fields["rating"], fields["description"]
+    else:
+        item_name: str = get_item_name(driver=driver)
+        item_price: str = get_item_price(driver=driver)
+        item_rating: float | str = get_item_rating(driver=driver)
+        item_description: str = get_item_description(driver=driver)
+    if menu_script:
+        item_instructions, item_country = manipulate_menu_script(driver=driver)
+    else:
+        item_instructions, item_country = manipulate_menu(driver=driver)
+
+    return create_item_dict(
+        number=number,
+        link=url,
+        name=item_name,
+        price=item_price,
+        rating=item_rating,
+        description=item_description,
+        instructions=item_instructions,
+        country=item_country
+    )
+
+
+def run_driver_pool(
+        tasks: list, handle, workers: int = 2, driver_factory=create_driver, on_result=None, on_error=None
+) -> list:
+    """
+    Функция выполняет handle(driver, task) для всех задач пулом браузеров.
+
+    Каждый поток запускает собственный драйвер и забирает задачи из общей очереди, поэтому медленные
+    страницы не задерживают остальных. Результаты возвращаются в порядке tasks. Если передан on_result,
+    каждый результат сразу передается в него и не накапливается. Если передан on_error, ошибки WebDriver
+    передаются в on_error(task, error), а обработка продолжается. Вызовы on_result и on_error
+    не пересекаются между потоками.
+    """
+    pending: queue.Queue = queue.Queue()
+    for index, task in enumerate(tasks):
+        pending.put((index, task))
+    results: list = [None] * len(tasks)
+    lock = threading.Lock()
+
+    def worker() -> None:
+        driver = driver_factory()
+        try:
+            while True:
+                try:
+                    index, task = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    result = handle(driver, task)
+                except WebDriverException as error:
+                    if on_error is None:
+                        raise
+                    with lock:
+                        on_error(task, error)
+                    continue
+                if on_result is None:
+                    results[index] = result
+                else:
+                    with lock:
+                        on_result(result)
+        finally:
+            driver.quit()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(worker) for _ in range(min(workers, len(tasks)))]
+        for future in futures:
+            future.result()
+
+    return results
+
+
+def scrape_products_parallel(
+        product_urls: list, workers: int = 2, limiter: RateLimiter | None = None, driver_factory=create_driver,
+        snapshot: bool = False, menu_script: bool = False, numbers: list | None = None, on_item=None,
+        on_failure=None, cache: PageCache | None = None
+) -> list[dict]:
+    """
+    Функция обрабатывает товары пулом браузеров.
+
+    Частота запросов всех браузеров ограничивается общим limiter (созданным с RateLimiter(workers=workers)).
+    Номера товаров (по умолчанию 1..N) назначаются до запуска потоков, поэтому результат упорядочен по number.
+    Если передан on_item, товары передаются в него по мере готовности. Если передан on_failure, товары с ошибкой
+    WebDriver передаются в on_failure(number, url, error), а в результате на их месте остается None.
+    """
+    def handle(driver, task: tuple) -> dict:
+        number, _url = task
+        return scrape_product(_url, driver, number, limiter, snapshot=snapshot, menu_script=menu_script, cache=cache)
+
+    def on_error(task: tuple, error: Exception) -> None:
+        on_failure(*task, error)
+
+    tasks = list(zip(numbers or range(1, len(product_urls) + 1), product_urls))
+    return run_driver_pool(tasks, handle, workers=workers, driver_factory=driver_factory, on_result=on_item,
+                           on_error=on_error if on_failure else None)
+
+
+@METRICS.timed("scraper_stage_seconds", stage="get_item_name")
 def get_item_name(driver: wd):
     """Функция осуществляет поиск поле <Название> и парсит соответствующее полю значение."""
     try:
-        p_item_name = driver.find_element(
-            By.XPATH, '//*[@id="__layout"]/div/main/article/div[4]/div[2]/div/div[2]/div[1]/div/div/div/div[1]')
+        p_item_name = driver.find_element(By.XPATH, SELECTORS["NAME_XPATH"])
         return p_item_name.text.strip()
     except NoSuchElementException:
+        METRICS.inc("scraper_field_fallbacks_total", field="name")
         return "Not available"
 
 
+@METRICS.timed("scraper_stage_seconds", stage="get_item_price")
 def get_item_price(driver: wd):
     """Функция осуществляет поиск поле <Цена> и парсит соответствующее полю значение."""
     try:
-        p_item_price = driver.find_element(
-            By.XPATH, '//*[@id="__layout"]/div/main/article/div[1]/div[1]/form/div[2]/div[1]/div[1]/div[1]')
+        p_item_price = driver.find_element(By.XPATH, SELECTORS["PRICE_XPATH"])
         price = p_item_price.text.strip()
         return price
     except NoSuchElementException:
+        METRICS.inc("scraper_field_fallbacks_total", field="price")
         return "Not available"
 
 
+@METRICS.timed("scraper_stage_seconds", stage="get_item_description")
 def get_item_description(driver: wd):
     """Функция осуществляет поиск поле <Описание> и парсит соответствующее полю значение."""
     try:
-        p_item_description = driver.find_element(
-            By.CLASS_NAME, r'G5-4J')
+        p_item_description = driver.find_element(By.CLASS_NAME, SELECTORS["DESCRIPTION_CLASS"])
         return p_item_description.text.replace("\n", "").strip()
     except NoSuchElementException:
+        METRICS.inc("scraper_field_fallbacks_total", field="description")
         return "Not available"
 
 
+@METRICS.timed("scraper_stage_seconds", stage="get_item_rating")
 def get_item_rating(driver: wd) -> float | str:
     """Функция осуществляет поиск поле <Рейтинг> и парсит соответствующее полю значение."""
     try:
-        p_item_rating = driver.find_element(
-            By.XPATH,
-            r'//*[@id="__layout"]/div/main/div[1]/div/div[3]/a[1]/div/div[1]')
+        p_item_rating = driver.find_element(By.XPATH, SELECTORS["RATING_XPATH"])
         return float(p_item_rating.text.strip())
     except NoSuchElementException:
+        METRICS.inc("scraper_field_fallbacks_total", field="rating")
         return "Not available"
 
 
+@METRICS.timed("scraper_stage_seconds", stage="manipulate_menu")
 def manipulate_menu(driver: wd):
     """Функция осуществляет поиск полей <О бренде> и <Применение> и парсит соответствующее полю значение."""
     p_item_instructions = "Not available"
@@ -156,25 +945,141 @@ def manipulate_menu(driver: wd):
 
     for i in range(1, 5):
         try:
-            driver.find_element(
-                By.XPATH,
-                f'//*[@id="__layout"]/div/main/article/div[4]/div[2]/div/div[1]/div[1]/div/button[{i}]').click()
-            menu_item = driver.find_element(
-                By.XPATH, f'//*[@id="__layout"]/div/main/article/div[4]/div[2]/div/div[1]/div[1]/div/button[{i}]/div')
+            driver.find_element(By.XPATH, SELECTORS["MENU_BUTTON_XPATH"].format(i)).click()
+            menu_item = driver.find_element(By.XPATH, SELECTORS["MENU_BUTTON_XPATH"].format(i) + "/div")
 
             if menu_item.text.strip() == "ПРИМЕНЕНИЕ":
                 p_item_instructions = driver.find_element(
-                    By.CLASS_NAME, r'G5-4J').text.replace("\n", "").strip()
+                    By.CLASS_NAME, SELECTORS["DESCRIPTION_CLASS"]).text.replace("\n", "").strip()
             elif menu_item.text.strip() == "О БРЕНДЕ":
                 p_item_country = driver.find_element(
-                    By.CLASS_NAME, r'G4xy5').text.strip()
+                    By.CLASS_NAME, SELECTORS["COUNTRY_CLASS"]).text.strip()
 
         except NoSuchElementException:
             continue
 
+    count_fallbacks(instructions=p_item_instructions, country=p_item_country)
     return p_item_instructions, p_item_country
 
 
+def count_fallbacks(**fields) -> None:
+    """Функция учитывает в метриках поля, которые не удалось найти на странице."""
+    for field, value in fields.items():
+        if value == "Not available":
+            METRICS.inc("scraper_field_fallbacks_total", field=field)
+
+
+@METRICS.timed("scraper_stage_seconds", stage="manipulate_menu_script")
+def manipulate_menu_script(driver: wd) -> tuple[str, str]:
+    """
+    Функция открывает вкладки описания товара одним вызовом execute_async_script и парсит поля
+    <Применение> и <О бренде>.
+
+    Результат совпадает с manipulate_menu, но вместо до 12 обращений к драйверу выполняется одно.
+    """
+    contents = driver.execute_async_script(MENU_SCRIPT, SELECTORS["MENU_BUTTON_XPATH"], SELECTORS["DESCRIPTION_CLASS"],
+                                           SELECTORS["COUNTRY_CLASS"]) or {}
+
+    p_item_instructions = contents.get("ПРИМЕНЕНИЕ")
+    p_item_country = contents.get("О БРЕНДЕ")
+    p_item_instructions = (p_item_instructions.replace("\n", "").strip()
+                           if p_item_instructions is not None else "Not available")
+    p_item_country = p_item_country.strip() if p_item_country is not None else "Not available"
+    count_fallbacks(instructions=p_item_instructions, country=p_item_country)
+    return p_item_instructions, p_item_country
+
+
+def benchmark_menu(product_urls: list, driver_factory=create_driver, limiter: RateLimiter | None = None) -> dict:
+    """Функция измеряет среднее время одного вызова manipulate_menu и manipulate_menu_script, в секундах."""
+    timings: dict = {"manipulate_menu": [], "manipulate_menu_script": []}
+    driver = driver_factory()
+    try:
+        for _url in product_urls:
+            for func in (manipulate_menu, manipulate_menu_script):
+                open_page(_url, driver, (By.XPATH, SELECTORS["NAME_XPATH"]), limiter)
+                started = time.perf_counter()
+                func(driver=driver)
+                timings[func.__name__].append(time.perf_counter() - started)
+    finally:
+        driver.quit()
+
+    result = {name: sum(values) / len(values) for name, values in timings.items() if values}
+    for name, seconds in result.items():
+        print("{}: {:.3f} с на вызов".format(name, seconds))
+    return result
+
+
+def class_xpath(class_name: str) -> str:
+    """Функция возвращает XPath, эквивалентный поиску By.CLASS_NAME."""
+    return f'//*[contains(concat(" ", normalize-space(@class), " "), " {class_name} ")]'
+
+
+@functools.lru_cache(maxsize=64)
+def compile_xpath(expression: str) -> etree.XPath:
+    """Функция компилирует выражение XPath; скомпилированные выражения переиспользуются при следующих вызовах."""
+    return etree.XPath(expression)
+
+
+def snapshot_selectors(selectors: dict | None = None) -> dict[str, etree.XPath]:
+    """Функция возвращает скомпилированные выражения для полей, извлекаемых из снимка страницы (extract_item_fields)."""
+    selectors = SELECTORS if selectors is None else selectors
+    return {
+        "name": compile_xpath(selectors["NAME_XPATH"]),
+        "price": compile_xpath(selectors["PRICE_XPATH"]),
+        "rating": compile_xpath(selectors["RATING_XPATH"]),
+        "description": compile_xpath(class_xpath(selectors["DESCRIPTION_CLASS"])),
+    }
+
+
+def load_selectors(path: str = SELECTORS_PATH) -> dict[str, str]:
+    """
+    Функция загружает селекторы из JSON-файла path и заменяет ими значения в SELECTORS,
+    чтобы после изменения разметки сайта достаточно было исправить файл, а не код.
+
+    Если файла нет, используются значения по умолчанию (DEFAULT_SELECTORS). Возвращает загруженные значения.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as file:
+        selectors = json.load(file)
+
+    unknown = set(selectors) - set(DEFAULT_SELECTORS)
+    if unknown:
+        raise ValueError("Неизвестные селекторы в {}: {}".format(path, ", ".join(sorted(unknown))))
+    for name, value in selectors.items():
+        try:
+            compile_xpath(class_xpath(value) if name.endswith("_CLASS") else value.format(1))
+        except etree.XPathSyntaxError as error:
+            raise ValueError("Некорректный селектор {} в {}: {}".format(name, path, error)) from error
+
+    SELECTORS.update(selectors)
+    return selectors
+
+
+@METRICS.timed("scraper_stage_seconds", stage="extract_item_fields")
+def extract_item_fields(page_source: str) -> dict[str, str | float]:
+    """
+    Функция извлекает название, цену, рейтинг и описание товара из снимка страницы.
+
+    Используются заранее скомпилированные выражения lxml (snapshot_selectors), поэтому функция не обращается
+    к драйверу и может выполняться в любом потоке.
+    """
+    tree = lxml_html.fromstring(page_source)
+    texts = {}
+    for field, expression in snapshot_selectors().items():
+        elements = expression(tree)
+        texts[field] = elements[0].text_content() if elements else None
+
+    count_fallbacks(**{field: "Not available" for field, text in texts.items() if text is None})
+    return {
+        "name": texts["name"].strip() if texts["name"] is not None else "Not available",
+        "price": texts["price"].strip() if texts["price"] is not None else "Not available",
+        "rating": float(texts["rating"].strip()) if texts["rating"] is not None else "Not available",
+        "description": (texts["description"].replace("\n", "").strip()
+                        if texts["description"] is not None else "Not available"),
+    }
+
+
 def create_item_dict(
         number: int, link: str, name: str, price: float = 0, rating: float | str = 0, description: str = "",
         instructions: str = "", country: str = ""
@@ -192,6 +1097,9 @@ def create_item_dict(
     }
 
 
+CSV_COLUMNS = ("number", "link", "name", "price", "rating", "description", "instructions", "country")
+
+
 def get_dataframe(items_dict: list[dict]) -> pd.DataFrame:
     """Функция преобразует список словарей в объект DataFrame библиотеки Pandas."""
     dataframe: pd.DataFrame = pd.DataFrame(items_dict)
@@ -203,5 +1111,819 @@ def save_to_csv(df: pd.DataFrame, path: str | None = "products.csv") -> None:
     df.to_csv(path, index=False, encoding="utf-8")
 
 
+PARQUET_SCHEMA = pa.schema([
+    ("number", pa.int32()),
+    ("link", pa.string()),
+    ("name", pa.string()),
+    ("price", pa.int32()),
+    ("rating", pa.float32()),
+    ("description", pa.string()),
+    ("instructions", pa.string()),
+    ("country", pa.dictionary(pa.int32(), pa.string())),
+])
+
+
+def normalize_text(series: pd.Series) -> pa.ChunkedArray | pa.Array:
+    """
+    Функция сводит пробельные символы в строках к одному пробелу и обрезает их по краям средствами pyarrow.compute;
+    пустые строки и "Not available" становятся пропусками.
+    """
+    values = pa.array(series.astype(pd.StringDtype("pyarrow")).array)
+    values = pc.utf8_trim_whitespace(pc.binary_join(pc.utf8_split_whitespace(values), pa.scalar(" ", values.type)))
+    missing = pc.or_(pc.equal(values, ""), pc.equal(values, "Not available"))
+    return pc.if_else(missing, pa.scalar(None, values.type), values)
+
+
+def to_string_array(values: pa.ChunkedArray | pa.Array) -> pd.arrays.ArrowStringArray:
+    """Функция оборачивает строки pyarrow в массив pandas без преобразования в объекты Python."""
+    return pd.arrays.ArrowStringArray(pc.cast(values, pa.string()))
+
+
+def clean_dataframe(df: pd.DataFrame, seen_links: set | None = None) -> pd.DataFrame:
+    """
+    Функция выполняет итоговую обработку товаров векторными операциями, без обхода строк в Python.
+
+    Пробельные символы в текстовых полях сводятся к одному пробелу, "Not available" заменяется пропусками,
+    товары без ссылки и повторы по ссылке отбрасываются (остается первый), цена приводится к целому числу рублей,
+    рейтинг - к дробному числу, страна - к категории; цены не больше нуля и рейтинги вне диапазона 0-5 заменяются
+    пропусками. Текстовые поля хранятся в строках pyarrow, что заметно компактнее объектов Python. Типы совпадают
+    с PARQUET_SCHEMA. Если передан seen_links, отбрасываются и ссылки из него, а новые
+    ссылки в него добавляются (для обработки файла частями).
+    """
+    link = pd.Series(to_string_array(normalize_text(df["link"])), index=df.index)
+    keep = link.notna() & ~link.duplicated()
+    if seen_links is not None:
+        keep &= ~link.isin(seen_links)
+        seen_links.update(link[keep])
+    df, link = df[keep], link[keep]
+
+    # Берется первое число (при скидке на странице указаны обе цены): "1 200 ₽ 1 500 ₽" -> 1200
+    price = pc.struct_field(pc.extract_regex(normalize_text(df["price"]), r"(?P<price>\d[\d ]*)"), [0])
+    price = pc.cast(pc.replace_substring(price, " ", ""), pa.int64())
+    cleaned = pd.DataFrame({
+        "number": pd.to_numeric(df["number"]).astype("Int32"),
+        "link": link,
+        "name": to_string_array(normalize_text(df["name"])),
+        "price": price.to_pandas().astype("Int32").array,
+        "rating": pd.to_numeric(df["rating"].mask(df["rating"] == "Not available"), errors="coerce").astype("Float32"),
+        "description": to_string_array(normalize_text(df["description"])),
+        "instructions": to_string_array(normalize_text(df["instructions"])),
+        "country": pd.Categorical(to_string_array(normalize_text(df["country"]))),
+    }, index=df.index)
+
+    cleaned["price"] = cleaned["price"].mask(cleaned["price"] <= 0)
+    cleaned["rating"] = cleaned["rating"].mask((cleaned["rating"] < 0) | (cleaned["rating"] > 5))
+    return cleaned.reset_index(drop=True)
+
+
+def save_to_parquet(df: pd.DataFrame, path: str = PARQUET_PATH) -> None:
+    """Сохранение обработанных товаров (clean_dataframe) в Parquet-файл."""
+    table = pa.Table.from_pandas(clean_dataframe(df), schema=PARQUET_SCHEMA, preserve_index=False)
+    pq.write_table(table, path)
+
+
+def csv_to_parquet(csv_path: str = CSV_PATH, parquet_path: str = PARQUET_PATH, chunksize: int = 10000) -> None:
+    """
+    Функция преобразует CSV-файл с товарами в Parquet-файл с приведенными типами.
+
+    Файл читается частями по chunksize строк, каждая часть обрабатывается clean_dataframe и записывается
+    отдельной группой строк, поэтому объем памяти зависит от количества товаров только через набор ссылок,
+    по которому отбрасываются повторы.
+    """
+    part_path = parquet_path + ".part"
+    seen_links: set = set()
+    with pq.ParquetWriter(part_path, PARQUET_SCHEMA) as writer:
+        for chunk in pd.read_csv(csv_path, dtype=str, keep_default_na=False, chunksize=chunksize):
+            writer.write_table(pa.Table.from_pandas(clean_dataframe(chunk, seen_links), schema=PARQUET_SCHEMA,
+                                                    preserve_index=False))
+    os.replace(part_path, parquet_path)
+
+
+def export_output(output: str = "csv") -> str:
+    """
+    Функция формирует выгрузку в нужном формате из сохраненного CSV_PATH: "csv", "parquet" или "both".
+
+    CSV_PATH не удаляется и при output="parquet": по нему следующий обход сравнивает товары (DeltaTracker)
+    и берет описания товаров (load_previous_details). Возвращает описание путей к итоговым файлам.
+    """
+    if output not in ("parquet", "both"):
+        return CSV_PATH
+    csv_to_parquet(CSV_PATH, PARQUET_PATH)
+    if output == "parquet":
+        return PARQUET_PATH
+    return f"{CSV_PATH} и {PARQUET_PATH}"
+
+
+class StreamingCsvWriter:
+    """
+    Потоковая запись товаров в CSV-файл.
+
+    Товары записываются во временный файл <path>.part пачками по flush_every штук, а каждые fsync_every
+    товаров файл сбрасывается на диск, поэтому при сбое сохраняется все, что было собрано. Товары,
+    пришедшие не по порядку, ожидают в буфере предыдущие номера, и файл всегда упорядочен по number.
+    При ordered=False товары записываются в порядке поступления, без буфера: так записываются уже упорядоченные
+    товары с пропусками в номерах (например, CrawlState.done_items при продолжении обхода).
+    При успешном завершении блока with временный файл переименовывается в path; формат совпадает с save_to_csv.
+    Заголовок (CSV_COLUMNS) записывается при открытии файла, поэтому и выгрузка без товаров остается корректным CSV.
+    """
+
+    def __init__(
+            self, path: str = CSV_PATH, flush_every: int = 50, fsync_every: int = 500, start_number: int = 1,
+            ordered: bool = True
+    ):
+        self.path = path
+        self.part_path = path + ".part"
+        self.flush_every = flush_every
+        self.fsync_every = fsync_every
+        self.next_number = start_number
+        self.ordered = ordered
+        self.pending: dict[int, dict] = {}
+        self.batch: list[dict] = []
+        self.written = 0
+        self.synced = 0
+        self.file = None
+
+    def __enter__(self) -> "StreamingCsvWriter":
+        self.file = open(self.part_path, "w", encoding="utf-8", newline="")
+        pd.DataFrame(columns=CSV_COLUMNS).to_csv(self.file, index=False)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.pending_to_batch(force=True)
+        self.flush()
+        self.sync()
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.part_path, self.path)
+        else:
+            print("Собранные товары сохранены в {}".format(self.part_path))
+
+    def write(self, item: dict) -> None:
+        """Метод добавляет товар в очередь на запись."""
+        if self.ordered:
+            self.pending[item["number"]] = item
+            self.pending_to_batch()
+        else:
+            self.batch.append(item)
+        self.flush_if_needed()
+
+    def skip(self, number: int) -> None:
+        """Метод сообщает, что товар с номером number записан не будет, чтобы следующие товары не ждали его."""
+        self.pending[number] = None
+        self.pending_to_batch()
+        self.flush_if_needed()
+
+    def flush_if_needed(self) -> None:
+        """Метод записывает пачку и сбрасывает файл на диск при достижении заданных порогов."""
+        if len(self.batch) >= self.flush_every:
+            self.flush()
+        if self.written - self.synced >= self.fsync_every:
+            self.sync()
+
+    def pending_to_batch(self, force: bool = False) -> None:
+        """Метод переносит в пачку товары, номера которых идут подряд; при force=True - все ожидающие."""
+        while self.next_number in self.pending:
+            item = self.pending.pop(self.next_number)
+            if item is not None:
+                self.batch.append(item)
+            self.next_number += 1
+        if force:
+            self.batch += [item for number, item in sorted(self.pending.items()) if item is not None]
+            self.pending = {}
+
+    def flush(self) -> None:
+        """Метод дописывает накопленную пачку товаров в файл."""
+        if not self.batch:
+            return
+        pd.DataFrame(self.batch, columns=CSV_COLUMNS).to_csv(self.file, header=False, index=False)
+        self.file.flush()
+        self.written += len(self.batch)
+        self.batch = []
+
+    def sync(self) -> None:
+        """Метод сбрасывает записанные данные на диск."""
+        os.fsync(self.file.fileno())
+        self.synced = self.written
+
+
+# ====================================================================================
+
+def xpath_to_css(xpath: str) -> str:
+    """Функция преобразует абсолютный XPath вида //*[@id="..."]/div[2]/a в CSS-селектор для BeautifulSoup."""
+    css_steps: list = []
+    for step in xpath.lstrip("/").split("/"):
+        id_match = re.fullmatch(r'\*\[@id="(.+)"]', step)
+        index_match = re.fullmatch(r'(\w+)\[(\d+)]', step)
+        if id_match:
+            css_steps.append("#" + id_match.group(1))
+        elif index_match:
+            css_steps.append("{}:nth-of-type({})".format(*index_match.groups()))
+        else:
+            css_steps.append(step)
+    return " > ".join(css_steps)
+
+
+def select_text(soup: BeautifulSoup, css: str) -> str | None:
+    """Функция возвращает текст первого элемента по CSS-селектору или None, если элемент не найден."""
+    element = soup.select_one(css)
+    if element is None:
+        return None
+    return element.get_text()
+
+
+async def iter_pages(
+        urls: list, concurrency: int = HTTP_CONCURRENCY, transport=None, limiter: RateLimiter | None = None
+):
+    """
+    Асинхронный генератор, который загружает страницы через общий пул keep-alive соединений httpx
+    и возвращает пары (индекс в urls, HTML) по мере загрузки.
+
+    Одновременно выполняется не больше concurrency запросов, поэтому в памяти находятся только их ответы.
+    Для страниц, которые не удалось загрузить, HTML равен None. Если передан limiter, частота запросов
+    ограничивается и подстраивается по времени и результату ответов.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, headers=HTTP_HEADERS, timeout=HTTP_TIMEOUT,
+                                 follow_redirects=True, transport=transport) as client:
+        async def fetch(index: int, url: str) -> tuple[int, str | None]:
+            if limiter:
+                await limiter.acquire_async()
+            started = time.perf_counter()
+            try:
+                response = await client.get(url)
+                response.raise_for_status()
+                html = response.text
+            except httpx.HTTPError:
+                html = None
+            elapsed = time.perf_counter() - started
+            METRICS.observe("scraper_stage_seconds", elapsed, stage="http_get")
+            if limiter:
+                limiter.record(elapsed, ok=html is not None)
+            return index, html
+
+        tasks = iter(enumerate(urls))
+        running: set = set()
+        try:
+            while True:
+                for index, _url in itertools.islice(tasks, concurrency - len(running)):
+                    running.add(asyncio.ensure_future(fetch(index, _url)))
+                if not running:
+                    return
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in running:
+                task.cancel()
+
+
+async def fetch_pages(
+        urls: list, concurrency: int = HTTP_CONCURRENCY, transport=None, limiter: RateLimiter | None = None
+) -> list[str | None]:
+    """
+    Функция асинхронно загружает страницы (см. iter_pages) и возвращает HTML в порядке urls;
+    для страниц, которые не удалось загрузить, возвращается None.
+    """
+    pages: list = [None] * len(urls)
+    async for index, html in iter_pages(urls, concurrency, transport, limiter):
+        pages[index] = html
+    return pages
+
+
+def get_items_urls_from_html(html: str, base_url: str = URL) -> list:
+    """Функция извлекает URL-адреса товаров из HTML страницы каталога."""
+    soup = BeautifulSoup(html, "html.parser")
+    product_urls: list = []
+    for item in soup.find_all(class_=SELECTORS["ITEMS_CLASS"]):
+        article = item.find("article")
+        link = article.find("a", href=True) if article else None
+        if link:
+            product_urls.append(urljoin(base_url, link["href"]))
+    return product_urls
+
+
+def get_all_products_urls_http(
+        start_page: int = 1, end_page: int | None = None, concurrency: int = HTTP_CONCURRENCY, transport=None,
+        limiter: RateLimiter | None = None
+) -> list:
+    """
+    Функция получает список URL-адресов продуктов, загружая страницы каталога через httpx.
+
+    Если end_page не указан, номер последней страницы определяется через find_last_page. Страницы, которые
+    не удалось загрузить, запрашиваются повторно; после LISTING_ATTEMPTS попыток выбрасывается RuntimeError,
+    чтобы сбой не принимался за конец каталога.
+    """
+    pages_urls: dict = {}
+
+    def fetch_pages_urls(pages: list) -> None:
+        for attempt in range(1, LISTING_ATTEMPTS + 1):
+            htmls = asyncio.run(fetch_pages([f"{URL}?p={page}" for page in pages], concurrency, transport, limiter))
+            failed = [page for page, html in zip(pages, htmls) if html is None]
+            for page, html in zip(pages, htmls):
+                if html is not None:
+                    pages_urls[page] = get_items_urls_from_html(html)
+                    print(f"Страница {page} обработана.")
+            if not failed:
+                return
+            print("Страницы {} не загрузились (попытка {} из {}).".format(failed, attempt, LISTING_ATTEMPTS))
+            pages = failed
+        raise RuntimeError("Страницы каталога {} не загрузились за {} попыток".format(pages, LISTING_ATTEMPTS))
+
+    if end_page is None:
+        def has_items(page: int) -> bool:
+            fetch_pages_urls([page])
+            return bool(pages_urls[page])
+
+        end_page = find_last_page(has_items, start_page)
+        print(f"Найдено страниц: {end_page - start_page + 1}.")
+
+    fetch_pages_urls([page for page in range(start_page, end_page + 1) if page not in pages_urls])
+
+    return merge_pages_urls(pages_urls[page] for page in range(start_page, end_page + 1))
+
+
+def parse_product_html(html: str, url: str, number: int) -> dict | None:
+    """
+    Функция разбирает HTML страницы товара теми же селекторами, что и get_item_* и manipulate_menu.
+
+    В браузере содержимое вкладки показывается в первом блоке DESCRIPTION_CLASS после клика по ней, а в HTML
+    от сервера кликов нет. Поэтому предполагается, что сервер отрисовывает по одному (возможно, скрытому) блоку
+    DESCRIPTION_CLASS на каждую вкладку <Описание> и <Применение> в порядке вкладок. Это допущение о разметке
+    сайта: если число блоков не совпадает с числом таких вкладок, содержимое <Применение> нельзя однозначно
+    связать с вкладкой, и страница передается браузеру.
+
+    Возвращает None, если страница требует выполнения JavaScript: разметка не отрисована на сервере,
+    содержимое <Применение> не связано с вкладкой или отсутствует содержимое вкладки <О бренде>.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    if soup.select_one("#__layout") is None:
+        return None
+
+    item_name = select_text(soup, xpath_to_css(SELECTORS["NAME_XPATH"]))
+    item_price = select_text(soup, xpath_to_css(SELECTORS["PRICE_XPATH"]))
+    item_rating = select_text(soup, xpath_to_css(SELECTORS["RATING_XPATH"]))
+    description_blocks = soup.find_all(class_=SELECTORS["DESCRIPTION_CLASS"])
+    menu_labels = [select_text(soup, xpath_to_css(SELECTORS["MENU_BUTTON_XPATH"].format(i) + "/div"))
+                   for i in range(1, 5)]
+    # Вкладки, содержимое которых отображается в блоках DESCRIPTION_CLASS, в порядке их следования
+    block_tabs = [label.strip() for label in menu_labels
+                  if label is not None and label.strip() in ("ОПИСАНИЕ", "ПРИМЕНЕНИЕ")]
+
+    item_instructions = "Not available"
+    item_country = "Not available"
+    for menu_label in menu_labels:
+        if menu_label is None:
+            continue
+        if menu_label.strip() == "ПРИМЕНЕНИЕ":
+            if len(description_blocks) != len(block_tabs):
+                return None
+            item_instructions = description_blocks[block_tabs.index("ПРИМЕНЕНИЕ")].get_text().replace("\n", "").strip()
+        elif menu_label.strip() == "О БРЕНДЕ":
+            country_block = soup.find(class_=SELECTORS["COUNTRY_CLASS"])
+            if country_block is None:
+                return None
+            item_country = country_block.get_text().strip()
+
+    return create_item_dict(
+        number=number,
+        link=url,
+        name=item_name.strip() if item_name is not None else "Not available",
+        price=item_price.strip() if item_price is not None else "Not available",
+        rating=float(item_rating.strip()) if item_rating is not None else "Not available",
+        description=(description_blocks[0].get_text().replace("\n", "").strip()
+                     if description_blocks else "Not available"),
+        instructions=item_instructions,
+        country=item_country
+    )
+
+
+def scrape_products_http(
+        product_urls: list, concurrency: int = HTTP_CONCURRENCY, limiter: RateLimiter | None = None,
+        driver_factory=create_driver, transport=None, numbers: list | None = None, on_item=None, on_failure=None,
+        cache: PageCache | None = None, workers: int = 1, chunk_size: int = HTTP_CHUNK_SIZE,
+        browser_limiter: RateLimiter | None = None
+) -> list[dict]:
+    """
+    Функция обрабатывает товары асинхронным HTTP-клиентом частями по chunk_size товаров.
+
+    Каждая страница разбирается сразу после загрузки. Страницы части, которые не удалось загрузить или которые
+    требуют JavaScript, дообрабатываются через Selenium workers браузерами до перехода к следующей части
+    (параметры numbers, on_failure и cache передаются в scrape_products_parallel), поэтому товары с соседними
+    номерами приходят не позже чем через одну часть. Если передан on_item, товары передаются в него по мере
+    готовности и не накапливаются; иначе возвращается список товаров, упорядоченный по number.
+    Если передан cache, загруженные страницы сохраняются в кеш.
+    Запросы HTTP-клиента ограничиваются limiter, а браузеров - browser_limiter (если он не передан, тоже limiter).
+    """
+    numbers = list(numbers or range(1, len(product_urls) + 1))
+    items_list: list[dict] = []
+    emit = on_item or items_list.append
+
+    for start in range(0, len(product_urls), chunk_size):
+        chunk_urls, chunk_numbers = product_urls[start:start + chunk_size], numbers[start:start + chunk_size]
+        fallback: list[tuple] = []
+
+        async def crawl() -> None:
+            async for index, html in iter_pages(chunk_urls, concurrency, transport, limiter):
+                number, _url = chunk_numbers[index], chunk_urls[index]
+                item = parse_product_html(html, _url, number) if html else None
+                if item is None:
+                    fallback.append((number, _url))
+                    continue
+                if cache is not None:
+                    cache_page(cache, _url, html, source="http")
+                emit(item)
+
+        asyncio.run(crawl())
+
+        if fallback:
+            fallback.sort()
+            print("Страниц, требующих браузер: {}".format(len(fallback)))
+            fallback_items = scrape_products_parallel(
+                [_url for number, _url in fallback], workers=workers, limiter=browser_limiter or limiter,
+                driver_factory=driver_factory, numbers=[number for number, _url in fallback], on_item=on_item,
+                on_failure=on_failure, cache=cache
+            )
+            items_list += [item for item in fallback_items if item is not None]
+
+    return sorted(items_list, key=lambda item: item["number"])
+
+
+# ====================================================================================
+
+def capture_tabs(driver) -> list:
+    """Функция возвращает HTML страницы после нажатия на каждую вкладку описания товара (None - вкладки нет)."""
+    return driver.execute_async_script(TABS_SCRIPT, SELECTORS["MENU_BUTTON_XPATH"]) or []
+
+
+def cache_page(cache: PageCache, url: str, page: str, tabs: list | None = None, source: str = "selenium") -> None:
+    """Функция сохраняет страницу товара и снимки ее вкладок в кеш."""
+    content = {"source": source, "page": page, "tabs": tabs or []}
+    cache.put(url, json.dumps(content, ensure_ascii=False).encode("utf-8"))
+
+
+def load_cached_page(cache: PageCache, url: str, date: str | None = None) -> dict | None:
+    """Функция загружает из кеша страницу товара, сохраненную cache_page."""
+    content = cache.get(url, date)
+    if content is None:
+        return None
+    return json.loads(content)
+
+
+class CachedElement:
+    """Элемент сохраненной страницы с той частью интерфейса WebElement, которую используют функции разбора."""
+
+    def __init__(self, element, driver: "CachedPageDriver"):
+        self.element = element
+        self.driver = driver
+
+    @property
+    def text(self) -> str:
+        return self.element.text_content()
+
+    def get_attribute(self, name: str) -> str | None:
+        value = self.element.get(name)
+        if name == "href" and value is not None:
+            return urljoin(self.driver.current_url, value)
+        return value
+
+    def find_element(self, by: str, value: str) -> "CachedElement":
+        return self.driver.find_element(by, value, root=self.element)
+
+    def find_elements(self, by: str, value: str) -> list:
+        return self.driver.find_elements(by, value, root=self.element)
+
+    def click(self) -> None:
+        self.driver.click(self.element)
+
+
+class CachedPageDriver:
+    """
+    Драйвер, который вместо браузера работает со страницей из кеша.
+
+    Элементы ищутся в снимке страницы через lxml, поэтому функции get_item_* и manipulate_menu работают
+    без изменений. Нажатие на кнопку вкладки описания переключает драйвер на снимок страницы,
+    сохраненный после нажатия на эту вкладку.
+    """
+
+    def __init__(self, url: str, page: str, tabs: list | None = None):
+        self.current_url = url
+        self.tree = lxml_html.fromstring(page)
+        self.tabs = tabs or []
+
+    @property
+    def page_source(self) -> str:
+        return lxml_html.tostring(self.tree, encoding="unicode")
+
+    def find_elements(self, by: str, value: str, root=None) -> list:
+        if by == By.XPATH:
+            xpath = value
+        elif by == By.CLASS_NAME:
+            xpath = class_xpath(value)
+        elif by == By.TAG_NAME:
+            xpath = "//" + value
+        else:
+            raise InvalidSelectorException("Способ поиска {} не поддерживается".format(by))
+
+        if root is None:
+            root = self.tree
+        elif xpath.startswith("//"):
+            xpath = "." + xpath
+        return [CachedElement(element, self) for element in root.xpath(xpath)]
+
+    def find_element(self, by: str, value: str, root=None) -> CachedElement:
+        elements = self.find_elements(by, value, root)
+        if not elements:
+            raise NoSuchElementException("{}: {}".format(by, value))
+        return elements[0]
+
+    def click(self, element) -> None:
+        for i, tab in enumerate(self.tabs, start=1):
+            if tab is not None and element in self.tree.xpath(SELECTORS["MENU_BUTTON_XPATH"].format(i)):
+                self.tree = lxml_html.fromstring(tab)
+                return
+
+
+def replay_products(cache: PageCache, date: str | None = None, snapshot: bool = False):
+    """
+    Функция повторно разбирает сохраненные в кеше страницы товаров без браузера и возвращает товары по одному.
+
+    Страницы, загруженные браузером, разбираются теми же функциями, что и при обходе (extract_product),
+    а загруженные HTTP-клиентом - функцией parse_product_html.
+    """
+    number = 0
+    for _url in cache.urls(date):
+        cached = load_cached_page(cache, _url, date)
+        if cached is None:
+            continue
+
+        if cached["source"] == "http":
+            item = parse_product_html(cached["page"], _url, number + 1)
+        else:
+            driver = CachedPageDriver(_url, cached["page"], cached["tabs"])
+            item = extract_product(driver, _url, number + 1, snapshot=snapshot, page_source=cached["page"])
+
+        if item is None:
+            print("Страницу {} невозможно разобрать без браузера.".format(_url))
+            continue
+        number += 1
+        yield item
+
+
+def replay(date: str | None = None, snapshot: bool = False, output: str = "csv") -> None:
+    """Функция формирует выгрузку из страниц, сохраненных в кеше, без обращения к сайту."""
+    print("Разбор страниц из кеша {}...".format(CACHE_DIR))
+    with PageCache(CACHE_DIR) as cache:
+        with StreamingCsvWriter(CSV_PATH) as writer:
+            for item in replay_products(cache, date, snapshot):
+                writer.write(item)
+    print("Все товары сохранены в {}".format(export_output(output)))
+
+
+# ====================================================================================
+
+def probe_product(driver, url: str, limiter: RateLimiter | None = None) -> dict:
+    """
+    Функция открывает страницу товара, сохраняет снимки страницы и всех вкладок за два обращения к браузеру
+    и применяет к ним сразу все селекторы (так же, как при разборе кеша в replay_products).
+    """
+    open_page(url, driver, (By.XPATH, SELECTORS["NAME_XPATH"]), limiter)
+    page = driver.page_source
+    cached_driver = CachedPageDriver(url, page, capture_tabs(driver))
+    return extract_product(cached_driver, url, 0, snapshot=True, page_source=page)
+
+
+def run_preflight(
+        listing_pages: int = 2, products: int = 6, workers: int = 2, driver_factory=create_driver,
+        limiter: RateLimiter | None = None
+) -> dict[str, float]:
+    """
+    Функция проверяет селекторы на нескольких страницах каталога и товаров до начала обхода.
+
+    Первые listing_pages страниц каталога и products товаров, равномерно выбранных из найденных на них,
+    загружаются параллельно workers браузерами. Возвращает долю страниц, на которых найдено каждое поле:
+    "items" - карточки товаров в каталоге, остальные ключи - поля товара.
+    """
+    pages_urls = run_driver_pool(list(range(1, listing_pages + 1)),
+                                 lambda driver, page: get_page_products_urls(driver, page, limiter),
+                                 workers=workers, driver_factory=driver_factory)
+    product_urls = merge_pages_urls(pages_urls)
+    step = max(1, len(product_urls) // products) if products else 1
+    sample = product_urls[::step][:products]
+
+    items: list = []
+    run_driver_pool(sample, lambda driver, _url: probe_product(driver, _url, limiter), workers=workers,
+                    driver_factory=driver_factory, on_result=items.append,
+                    on_error=lambda _url, error: items.append({}))
+
+    rates = {"items": sum(1 for page_urls in pages_urls if page_urls) / max(1, listing_pages)}
+    for field in ("name", "price", "rating", "description", "instructions", "country"):
+        found = sum(1 for item in items if item.get(field, "Not available") != "Not available")
+        rates[field] = found / len(items) if items else 0.0
+
+    print("Проверка селекторов: страниц каталога - {}, товаров - {}.".format(listing_pages, len(items)))
+    for field, rate in rates.items():
+        print("  {:<13} {:>4.0%}".format(field, rate))
+    return rates
+
+
+def check_preflight(rates: dict[str, float], threshold: float = PREFLIGHT_THRESHOLD) -> None:
+    """Функция прерывает работу, если доля найденных значений какого-либо поля ниже threshold."""
+    failed = {field: rate for field, rate in rates.items() if rate < threshold}
+    if failed:
+        raise SystemExit("Проверка селекторов не пройдена (порог {:.0%}): {}. Исправьте {}.".format(
+            threshold, ", ".join("{} - {:.0%}".format(field, rate) for field, rate in failed.items()),
+            SELECTORS_PATH))
+
+
+# ====================================================================================
+
+def process_queue_task(
+        task: Task, driver, work_queue: WorkQueue, limiter: RateLimiter | None = None, snapshot: bool = False,
+        menu_script: bool = False
+) -> None:
+    """
+    Функция выполняет задачу из очереди.
+
+    Для страницы каталога в очередь добавляются найденные на ней товары и следующая страница той же категории,
+    для страницы товара в очередь сохраняются собранные поля. Страница каталога, которую не удалось загрузить,
+    не завершает категорию: TimeoutException возвращает задачу в очередь. Повторное выполнение задачи после
+    истечения аренды не создает дубликатов.
+    """
+    if task.kind == "listing":
+        page_urls = get_page_products_urls(driver, task.page, limiter, url=task.url)
+        if page_urls:
+            work_queue.put("product", page_urls, task.category)
+            work_queue.put("listing", [task.url], task.category, task.page + 1)
+        work_queue.complete(task)
+    else:
+        item = scrape_product(task.url, driver, task.id, limiter, snapshot=snapshot, menu_script=menu_script)
+        if not work_queue.complete(task, item):
+            print("Аренда задачи {} истекла, результат получен другим процессом.".format(task.url))
+
+
+def run_queue_worker(
+        work_queue: WorkQueue, workers: int = 1, driver_factory=create_driver, limiter: RateLimiter | None = None,
+        snapshot: bool = False, menu_script: bool = False, poll_interval: float = 5.0
+) -> None:
+    """
+    Функция обрабатывает задачи из общей очереди workers браузерами, пока координатор не отметит обход завершенным.
+
+    Рабочих процессов на одной или нескольких машинах может быть сколько угодно, и их можно запускать раньше
+    координатора: пустая очередь опрашивается каждые poll_interval секунд. Если к запуску предыдущий обход
+    в очереди уже завершен, рабочий ожидает завершения следующего. Задачи распределяются через аренду в очереди;
+    ошибки WebDriver возвращают задачу в очередь для повторной попытки.
+    """
+    generation, finished = work_queue.run_state()
+    awaited_generation = generation + 1 if finished else generation
+
+    def is_run_finished() -> bool:
+        generation, finished = work_queue.run_state()
+        return finished and generation >= awaited_generation
+
+    def worker(index: int) -> None:
+        worker_id = "{}-{}-{}".format(socket.gethostname(), os.getpid(), index)
+        driver = driver_factory()
+        try:
+            while True:
+                tasks = work_queue.lease(worker_id)
+                if not tasks:
+                    if is_run_finished():
+                        return
+                    time.sleep(poll_interval)
+                    continue
+                for task in tasks:
+                    try:
+                        process_queue_task(task, driver, work_queue, limiter, snapshot, menu_script)
+                    except WebDriverException as error:
+                        print("Ошибка при обработке {}: {}".format(task.url, error))
+                        work_queue.fail(task, error)
+        finally:
+            driver.quit()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for future in [executor.submit(worker, index) for index in range(max(1, workers))]:
+            future.result()
+
+
+def run_coordinator(
+        work_queue: WorkQueue, categories: list, output: str = "csv", poll_interval: float = 10.0
+) -> None:
+    """
+    Функция начинает обход (WorkQueue.begin_run), добавляет в очередь первые страницы категорий categories,
+    ожидает, пока рабочие процессы обработают все задачи, отмечает обход завершенным, чтобы рабочие остановились,
+    и сохраняет собранные товары в CSV_PATH (и/или PARQUET_PATH, см. export_output).
+    """
+    generation = work_queue.begin_run()
+    for category in categories:
+        work_queue.put("listing", [category], category, 1)
+    print("Обход {}: категорий в очереди - {}.".format(generation, len(categories)))
+
+    while not work_queue.is_drained():
+        print("Статус очереди: {}".format(work_queue.counts()))
+        time.sleep(poll_interval)
+    work_queue.end_run()
+
+    with StreamingCsvWriter(CSV_PATH) as writer:
+        for number, item in enumerate(work_queue.results(), start=1):
+            writer.write({**item, "number": number})
+    print("Все товары сохранены в {}. Статус очереди: {}".format(export_output(output), work_queue.counts()))
+
+
+def parse_args(argv: list | None = None) -> argparse.Namespace:
+    """Функция разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(description="Парсер товаров онлайн-магазина \"Золотое яблоко\".")
+    parser.add_argument("--workers", type=int, default=1, help="количество параллельных браузеров")
+    parser.add_argument("--engine", choices=("selenium", "http"), default="selenium",
+                        help="способ загрузки страниц: браузер или асинхронный HTTP-клиент")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="извлекать поля товара из одного снимка page_source")
+    parser.add_argument("--menu-script", action="store_true",
+                        help="открывать вкладки описания товара одним скриптом в браузере")
+    parser.add_argument("--benchmark-menu", nargs="+", metavar="URL",
+                        help="сравнить время manipulate_menu и manipulate_menu_script на указанных товарах")
+    parser.add_argument("--rps", type=float, default=REQUESTS_PER_SECOND,
+                        help="максимальное количество запросов к сайту в секунду на один браузер "
+                             "(HTTP-клиент --engine http ограничивается --http-rps)")
+    parser.add_argument("--http-rps", type=float, default=HTTP_REQUESTS_PER_SECOND,
+                        help="максимальное количество запросов к сайту в секунду для HTTP-клиента --engine http "
+                             "(на все одновременные запросы)")
+    parser.add_argument("--lean", action="store_true",
+                        help="облегченный профиль браузера: без окна, изображений, шрифтов и трекеров")
+    parser.add_argument("--restart-every", type=int, default=DRIVER_MAX_PAGES, metavar="N",
+                        help="перезапускать браузер каждые N страниц (0 - не перезапускать)")
+    parser.add_argument("--max-rss-mb", type=float, default=DRIVER_MAX_RSS_MB,
+                        help="перезапускать браузер, если его процессы заняли больше указанного объема памяти, МБ")
+    parser.add_argument("--benchmark-profiles", nargs="+", metavar="URL",
+                        help="сравнить время загрузки и память обычного и облегченного профилей на указанных товарах")
+    parser.add_argument("--output", choices=("csv", "parquet", "both"), default="csv",
+                        help="формат выгрузки: CSV, Parquet с приведенными типами полей или оба "
+                             "(CSV сохраняется всегда как основа для --delta и --listing)")
+    parser.add_argument("--cache", action="store_true",
+                        help="сохранять загруженные страницы товаров в сжатый кеш для повторного разбора")
+    parser.add_argument("--replay", nargs="?", const="", metavar="DATE",
+                        help="разобрать страницы из кеша без браузера (за дату YYYY-MM-DD, по умолчанию - последние)")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="периодически выгружать время этапов обработки и счетчики ошибок в указанный файл")
+    parser.add_argument("--metrics-format", choices=("jsonl", "prometheus"), default="jsonl",
+                        help="формат файла метрик: JSON Lines или textfile для Prometheus node_exporter")
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL,
+                        help="интервал выгрузки метрик, с")
+    parser.add_argument("--listing", action="store_true",
+                        help="брать цены из страниц каталога и открывать только товары, которых нет в прошлой выгрузке")
+    parser.add_argument("--delta", action="store_true",
+                        help="сохранить в changes.csv только новые, удаленные и изменившиеся товары")
+    parser.add_argument("--coordinator", nargs="+", metavar="CATEGORY_URL",
+                        help="добавить категории в общую очередь, дождаться обработки и сохранить результат")
+    parser.add_argument("--worker", action="store_true",
+                        help="обрабатывать задачи из общей очереди (--workers браузеров в этом процессе)")
+    parser.add_argument("--queue", default=QUEUE_URL, metavar="URL",
+                        help="адрес общей очереди задач, например sqlite:///work_queue.sqlite3")
+    parser.add_argument("--visibility-timeout", type=float, default=VISIBILITY_TIMEOUT,
+                        help="время аренды задачи, с: после него задача незавершившегося процесса выдается снова")
+    parser.add_argument("--selectors", default=SELECTORS_PATH, metavar="PATH",
+                        help="JSON-файл с селекторами, заменяющими константы из кода")
+    parser.add_argument("--preflight", action="store_true",
+                        help="перед обходом проверить селекторы на нескольких страницах и прервать работу при сбое")
+    parser.add_argument("--preflight-threshold", type=float, default=PREFLIGHT_THRESHOLD,
+                        help="минимальная доля страниц, на которых должно находиться каждое поле")
+    parser.add_argument("--check-selectors", action="store_true",
+                        help="только проверить селекторы и вывести долю найденных значений по полям")
+    parser.add_argument("--resume", action="store_true",
+                        help="продолжить прерванный обход: пропустить обработанные товары и повторить ошибки")
+    return parser.parse_args(argv)
+
+
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    load_selectors(args.selectors)
+    if args.benchmark_menu:
+        benchmark_menu(args.benchmark_menu, driver_factory=functools.partial(create_driver, lean=args.lean),
+                       limiter=RateLimiter(max_rate=args.rps))
+    elif args.benchmark_profiles:
+        benchmark_profiles(args.benchmark_profiles, limiter=RateLimiter(max_rate=args.rps))
+    elif args.check_selectors:
+        check_preflight(run_preflight(workers=args.workers,
+                                      limiter=RateLimiter(max_rate=args.rps, workers=args.workers),
+                                      driver_factory=functools.partial(create_driver, lean=args.lean)),
+                        args.preflight_threshold)
+    elif args.coordinator:
+        with open_queue(args.queue, visibility_timeout=args.visibility_timeout) as work_queue:
+            run_coordinator(work_queue, args.coordinator, output=args.output)
+    elif args.worker:
+        with open_queue(args.queue, visibility_timeout=args.visibility_timeout) as work_queue:
+            run_queue_worker(work_queue, workers=args.workers,
+                             limiter=RateLimiter(max_rate=args.rps, workers=args.workers),
+                             driver_factory=functools.partial(
+                                 ManagedDriver, functools.partial(create_driver, lean=args.lean),
+                                 max_pages=args.restart_every, max_rss_mb=args.max_rss_mb),
+                             snapshot=args.snapshot, menu_script=args.menu_script)
+    elif args.replay is not None:
+        replay(date=args.replay or None, snapshot=args.snapshot, output=args.output)
+    else:
+        main(workers=args.workers, engine=args.engine, snapshot=args.snapshot, menu_script=args.menu_script,
+             resume=args.resume, rps=args.rps, lean=args.lean, max_pages=args.restart_every,
+             max_rss_mb=args.max_rss_mb, output=args.output, cache=args.cache, metrics=args.metrics,
+             metrics_format=args.metrics_format, metrics_interval=args.metrics_interval, delta=args.delta,
+             listing=args.listing, preflight=args.preflight, preflight_threshold=args.preflight_threshold,
+             http_rps=args.http_rps)
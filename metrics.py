@@ -0,0 +1,158 @@
+import bisect
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+METRICS_INTERVAL = 30
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics:
+    """
+    Потокобезопасный реестр счетчиков и гистограмм времени.
+
+    Каждая метрика идентифицируется именем и набором меток (например, stage="driver_get"). Гистограмма хранит
+    количество наблюдений, их сумму и число попаданий в каждый интервал buckets, поэтому запись одного
+    наблюдения стоит одного поиска по короткому списку и не требует хранить сами значения.
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters: dict = {}
+        self.histograms: dict = {}
+
+    def reset(self) -> None:
+        """Метод обнуляет все метрики."""
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Метод увеличивает счетчик name с метками labels на value."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """Метод добавляет наблюдение seconds в гистограмму name с метками labels."""
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"count": 0, "sum": 0.0, "buckets": [0] * len(self.buckets)}
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            if index < len(self.buckets):
+                histogram["buckets"][index] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        """Контекстный менеджер, который записывает время выполнения блока в гистограмму name."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name: str, **labels):
+        """Декоратор, который записывает время выполнения функции в гистограмму name."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict:
+        """Метод возвращает текущие значения метрик в виде словаря, пригодного для JSON."""
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in self.counters.items()]
+            histograms = [{"name": name, "labels": dict(labels), "count": histogram["count"],
+                           "sum": histogram["sum"], "buckets": dict(zip(self.buckets, histogram["buckets"]))}
+                          for (name, labels), histogram in self.histograms.items()]
+        return {"time": time.time(), "counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        """Метод возвращает метрики в текстовом формате Prometheus (с накопительными интервалами гистограмм)."""
+        def format_labels(labels: dict, **extra) -> str:
+            pairs = {**labels, **extra}
+            if not pairs:
+                return ""
+            return "{" + ",".join('{}="{}"'.format(key, value) for key, value in pairs.items()) + "}"
+
+        snapshot = self.snapshot()
+        lines: list = []
+        for name in sorted({counter["name"] for counter in snapshot["counters"]}):
+            lines.append("# TYPE {} counter".format(name))
+            lines += ["{}{} {}".format(name, format_labels(counter["labels"]), counter["value"])
+                      for counter in snapshot["counters"] if counter["name"] == name]
+        for name in sorted({histogram["name"] for histogram in snapshot["histograms"]}):
+            lines.append("# TYPE {} histogram".format(name))
+            for histogram in snapshot["histograms"]:
+                if histogram["name"] != name:
+                    continue
+                cumulative = 0
+                for bound, count in histogram["buckets"].items():
+                    cumulative += count
+                    lines.append("{}_bucket{} {}".format(name, format_labels(histogram["labels"], le=bound),
+                                                         cumulative))
+                lines.append("{}_bucket{} {}".format(name, format_labels(histogram["labels"], le="+Inf"),
+                                                     histogram["count"]))
+                lines.append("{}_sum{} {}".format(name, format_labels(histogram["labels"]), histogram["sum"]))
+                lines.append("{}_count{} {}".format(name, format_labels(histogram["labels"]), histogram["count"]))
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class MetricsExporter:
+    """
+    Периодическая выгрузка метрик в файл в фоновом потоке.
+
+    В формате "jsonl" каждые interval секунд в конец файла дописывается снимок всех метрик, в формате
+    "prometheus" файл целиком заменяется (через временный файл, как того требует textfile collector
+    node_exporter). Последний снимок записывается при выходе из контекста.
+    """
+
+    def __init__(self, path: str, metrics_format: str = "jsonl", interval: float = METRICS_INTERVAL,
+                 metrics: Metrics = METRICS):
+        if metrics_format not in ("jsonl", "prometheus"):
+            raise ValueError("Неизвестный формат метрик: {}".format(metrics_format))
+        self.path = path
+        self.metrics_format = metrics_format
+        self.interval = interval
+        self.metrics = metrics
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self) -> "MetricsExporter":
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.export()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def export(self) -> None:
+        """Метод записывает текущие значения метрик в файл."""
+        if self.metrics_format == "jsonl":
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(self.metrics.snapshot(), ensure_ascii=False) + "\n")
+        else:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                file.write(self.metrics.to_prometheus())
+            os.replace(temp_path, self.path)
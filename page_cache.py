@@ -0,0 +1,141 @@
+import datetime
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CACHE_DIR = "page_cache"
+CACHE_MAX_SIZE_MB = 2048
+
+
+class PageCache:
+    """
+    Сжатый кеш загруженных страниц на диске.
+
+    Содержимое хранится по адресу, вычисленному из хеша SHA-256 (одинаковые страницы хранятся один раз),
+    и сжимается zstd, если установлен пакет zstandard, иначе gzip. Индекс в SQLite связывает пару (URL, дата)
+    с содержимым. Когда общий размер сжатых файлов превышает max_size_mb, удаляются файлы,
+    к которым дольше всего не обращались, вместе с их записями в индексе.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_size_mb: float = CACHE_MAX_SIZE_MB):
+        self.directory = directory
+        self.max_size = max_size_mb * 2 ** 20
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS objects (
+                digest TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT NOT NULL,
+                date TEXT NOT NULL,
+                digest TEXT NOT NULL REFERENCES objects (digest),
+                PRIMARY KEY (url, date)
+            );
+        """)
+        self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+    def __enter__(self) -> "PageCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Метод закрывает индекс кеша."""
+        self.connection.close()
+
+    def put(self, url: str, content: bytes, date: str | None = None) -> str:
+        """Метод сохраняет содержимое страницы url за дату date (по умолчанию - сегодня) и возвращает его хеш."""
+        date = date or datetime.date.today().isoformat()
+        digest = hashlib.sha256(content).hexdigest()
+
+        with self.lock:
+            row = self.connection.execute("SELECT path FROM objects WHERE digest = ?", (digest,)).fetchone()
+            with self.connection:
+                if row is None:
+                    path = self.write_object(digest, content)
+                    size = os.path.getsize(path)
+                    self.connection.execute("INSERT INTO objects (digest, path, size, accessed) VALUES (?, ?, ?, ?)",
+                                            (digest, path, size, time.time()))
+                    self.size += size
+                self.connection.execute("INSERT OR REPLACE INTO pages (url, date, digest) VALUES (?, ?, ?)",
+                                        (url, date, digest))
+            self.evict()
+        return digest
+
+    def get(self, url: str, date: str | None = None) -> bytes | None:
+        """Метод возвращает содержимое страницы url за дату date (по умолчанию - за последнюю) или None."""
+        with self.lock:
+            query = "SELECT o.digest, o.path FROM pages p JOIN objects o ON o.digest = p.digest WHERE p.url = ?"
+            if date is None:
+                row = self.connection.execute(query + " ORDER BY p.date DESC LIMIT 1", (url,)).fetchone()
+            else:
+                row = self.connection.execute(query + " AND p.date = ?", (url, date)).fetchone()
+            if row is None:
+                return None
+            digest, path = row
+            with self.connection:
+                self.connection.execute("UPDATE objects SET accessed = ? WHERE digest = ?", (time.time(), digest))
+        return self.read_object(path)
+
+    def urls(self, date: str | None = None) -> list:
+        """Метод возвращает URL страниц за дату date (по умолчанию - все) в порядке их первого сохранения."""
+        if date is None:
+            rows = self.connection.execute("SELECT url FROM pages GROUP BY url ORDER BY MIN(rowid)")
+        else:
+            rows = self.connection.execute("SELECT url FROM pages WHERE date = ? ORDER BY rowid", (date,))
+        return [url for (url,) in rows]
+
+    def write_object(self, digest: str, content: bytes) -> str:
+        """Метод сжимает содержимое и записывает его в файл, путь к которому определяется хешем."""
+        if zstandard is not None:
+            data, extension = zstandard.ZstdCompressor(level=10).compress(content), ".zst"
+        else:
+            data, extension = gzip.compress(content, compresslevel=6), ".gz"
+
+        folder = os.path.join(self.directory, digest[:2])
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, digest + extension)
+        with open(path, "wb") as file:
+            file.write(data)
+        return path
+
+    @staticmethod
+    def read_object(path: str) -> bytes:
+        """Метод читает и распаковывает файл кеша; формат определяется по расширению."""
+        with open(path, "rb") as file:
+            data = file.read()
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise RuntimeError("Для чтения {} требуется пакет zstandard".format(path))
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def evict(self) -> None:
+        """Метод удаляет давно не использовавшиеся файлы, пока размер кеша превышает допустимый."""
+        while self.size > self.max_size:
+            row = self.connection.execute(
+                "SELECT digest, path, size FROM objects ORDER BY accessed, rowid LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return
+            digest, path, size = row
+            with self.connection:
+                self.connection.execute("DELETE FROM pages WHERE digest = ?", (digest,))
+                self.connection.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+            if os.path.exists(path):
+                os.remove(path)
+            self.size -= size
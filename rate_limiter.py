@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+
+REQUESTS_PER_SECOND = 0.5
+
+
+class RateLimiter:
+    """
+    Общий ограничитель частоты запросов к сайту для всех потоков и корутин.
+
+    Работает по принципу token bucket: каждый запрос забирает один токен, а токены пополняются со скоростью rate
+    запросов в секунду. Скорость подстраивается по схеме AIMD: после быстрого успешного ответа она растет
+    на increase (но не выше max_rate), а после ошибки или ответа медленнее slow_threshold секунд
+    умножается на decrease (но не ниже min_rate).
+
+    Частоты и запас токенов задаются на один поток: ограничитель, общий для workers потоков, пропускает в workers
+    раз больше запросов, поэтому производительность растет с числом браузеров.
+    """
+
+    def __init__(
+            self, max_rate: float = REQUESTS_PER_SECOND, min_rate: float = 0.05, burst: int = 1,
+            increase: float = 0.05, decrease: float = 0.5, slow_threshold: float = 5.0, workers: int = 1
+    ):
+        workers = max(1, workers)
+        self.max_rate = max_rate * workers
+        self.min_rate = min(min_rate, max_rate) * workers
+        self.rate = self.max_rate
+        self.burst = burst * workers
+        self.increase = increase * workers
+        self.decrease = decrease
+        self.slow_threshold = slow_threshold
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Метод забирает токен и возвращает время в секундах, которое нужно подождать перед запросом."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def acquire(self) -> None:
+        """Метод ожидает разрешения на следующий запрос."""
+        time.sleep(self.reserve())
+
+    async def acquire_async(self) -> None:
+        """Метод ожидает разрешения на следующий запрос, не блокируя цикл событий."""
+        await asyncio.sleep(self.reserve())
+
+    def record(self, elapsed: float, ok: bool = True) -> None:
+        """Метод учитывает время и результат ответа и подстраивает скорость запросов."""
+        with self.lock:
+            if ok and elapsed < self.slow_threshold:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+            else:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
@@ -0,0 +1,181 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from lxml import etree
+
+from main import SELECTORS
+
+LISTING_PATH = "/parfjumerija"
+COUNTRIES = ["Франция", "Италия", "Испания", "ОАЭ", "Россия", "США"]
+
+# Переключает содержимое первого блока описания (класс подставляется при формировании страницы) при нажатии
+# на вкладку, как на настоящем сайте
+TABS_JS = """
+document.addEventListener("click", (event) => {
+    const button = event.target.closest("button[data-content]");
+    if (button) document.getElementsByClassName("%s")[0].textContent = button.dataset.content;
+});
+"""
+
+
+def build_element(root, xpath: str):
+    """
+    Функция создает в root цепочку элементов, которую находит абсолютный XPath вида //*[@id="__layout"]/div[2]/a,
+    и возвращает последний элемент. Недостающие соседние элементы создаются пустыми.
+    """
+    node = root
+    for step in xpath.split("/")[3:]:
+        match = re.fullmatch(r"(\w+)(?:\[(\d+)])?", step)
+        tag, index = match.group(1), int(match.group(2) or 1)
+        children = [child for child in node if child.tag == tag]
+        while len(children) < index:
+            children.append(etree.SubElement(node, tag))
+        node = children[index - 1]
+    return node
+
+
+def render_document(layout, state: dict | None = None) -> bytes:
+    """Функция оборачивает корневой элемент #__layout в HTML-документ; state встраивается как window.__NUXT__."""
+    body = etree.tostring(layout, encoding="unicode", method="html")
+    script = TABS_JS % SELECTORS["DESCRIPTION_CLASS"]
+    if state is not None:
+        script = "window.__NUXT__ = {};\n{}".format(json.dumps(state, ensure_ascii=False), script)
+    return "<!DOCTYPE html><html><head><meta charset='utf-8'></head><body>{}<script>{}</script></body></html>".format(
+        body, script).encode("utf-8")
+
+
+def product_fields(product_id: int) -> dict:
+    """Функция возвращает поля товара product_id; значения постоянны для одного и того же номера."""
+    rng = random.Random(product_id)
+    return {
+        "name": f"Аромат {product_id}",
+        "price": rng.randint(500, 40000),
+        "rating": round(rng.uniform(3, 5), 1),
+        "description": f"Описание товара {product_id}. " * rng.randint(5, 30),
+        "instructions": f"Нанести на кожу. Товар {product_id}.",
+        "country": rng.choice(COUNTRIES),
+    }
+
+
+def render_listing(base_url: str, product_ids: list) -> bytes:
+    """Функция формирует страницу каталога с карточками товаров product_ids и их ценами в состоянии Nuxt."""
+    layout = etree.Element("div", id="__layout")
+    items = etree.SubElement(etree.SubElement(layout, "main"), "div")
+    for product_id in product_ids:
+        article = etree.SubElement(etree.SubElement(items, "div", {"class": SELECTORS["ITEMS_CLASS"]}), "article")
+        link = etree.SubElement(article, "a", href=f"{base_url}/product-{product_id}")
+        link.text = f"Товар {product_id}"
+
+    products = []
+    for product_id in product_ids:
+        fields = product_fields(product_id)
+        products.append({"url": f"/product-{product_id}", "name": fields["name"],
+                         "price": {"amount": fields["price"], "currency": "RUB"}, "rating": fields["rating"]})
+    return render_document(layout, {"data": [{"catalog": {"products": products}}], "state": {}})
+
+
+def render_product(product_id: int) -> bytes:
+    """Функция формирует страницу товара, разметка которой соответствует текущим селекторам main.SELECTORS."""
+    fields = product_fields(product_id)
+    description, instructions, country = fields["description"], fields["instructions"], fields["country"]
+
+    layout = etree.Element("div", id="__layout")
+    build_element(layout, SELECTORS["NAME_XPATH"]).text = fields["name"]
+    build_element(layout, SELECTORS["PRICE_XPATH"]).text = "{:,}".format(fields["price"]).replace(",", " ") + " ₽"
+    build_element(layout, SELECTORS["RATING_XPATH"]).text = str(fields["rating"])
+
+    tabs = [("ОПИСАНИЕ", description), ("ПРИМЕНЕНИЕ", instructions), ("О БРЕНДЕ", description)]
+    for i, (title, content) in enumerate(tabs, start=1):
+        button = build_element(layout, SELECTORS["MENU_BUTTON_XPATH"].format(i))
+        button.set("data-content", content)
+        etree.SubElement(button, "div").text = title
+
+    main_element = build_element(layout, '//*[@id="__layout"]/div/main')
+    description_class = SELECTORS["DESCRIPTION_CLASS"]
+    etree.SubElement(main_element, "div", {"class": description_class}).text = description
+    etree.SubElement(main_element, "div", {"class": description_class}, hidden="hidden").text = instructions
+    etree.SubElement(main_element, "div", {"class": SELECTORS["COUNTRY_CLASS"]}).text = country
+    return render_document(layout)
+
+
+class StandInSite:
+    """
+    Локальный сайт, имитирующий каталог "Золотого яблока", для тестов и замеров производительности.
+
+    Страницы каталога LISTING_PATH?p=N содержат по per_page карточек товаров, страницы после pages пусты.
+    Каждый ответ задерживается в среднем на latency секунд, а доля failure_rate запросов завершается ошибкой 503.
+    """
+
+    def __init__(self, pages: int = 5, per_page: int = 20, latency: float = 0.0, failure_rate: float = 0.0,
+                 seed: int = 0, port: int = 0):
+        self.pages = pages
+        self.per_page = per_page
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler_class())
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "StandInSite":
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def listing_url(self) -> str:
+        return self.url + LISTING_PATH
+
+    def product_ids(self, page: int) -> list:
+        """Метод возвращает номера товаров на странице каталога page."""
+        if not 1 <= page <= self.pages:
+            return []
+        return list(range((page - 1) * self.per_page + 1, page * self.per_page + 1))
+
+    def respond(self, path: str) -> tuple[int, bytes]:
+        """Метод формирует код ответа и содержимое страницы по пути запроса."""
+        with self.lock:
+            self.requests += 1
+            delay = self.rng.uniform(0.5, 1.5) * self.latency
+            failed = self.rng.random() < self.failure_rate
+        time.sleep(delay)
+        if failed:
+            return 503, b"Service Unavailable"
+
+        parsed = urlparse(path)
+        product = re.fullmatch(r"/product-(\d+)", parsed.path)
+        if parsed.path == LISTING_PATH:
+            page = int(parse_qs(parsed.query).get("p", ["1"])[0])
+            return 200, render_listing(self.url, self.product_ids(page))
+        if product:
+            return 200, render_product(int(product.group(1)))
+        return 404, b"Not Found"
+
+    def handler_class(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                status, body = site.respond(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
+
@@ -1,14 +1,57 @@
+import json
 import os
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import Mock, MagicMock, patch
 
+import httpx
 import pandas as pd
-from selenium.common.exceptions import NoSuchElementException
+import pyarrow.parquet as pq
+from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
 
 from main import get_items_urls_on_page, get_all_products_urls, get_item_name, \
     get_item_price, get_item_description, get_item_rating, manipulate_menu, create_item_dict, get_dataframe, \
-    save_to_csv, make_selenium_get_request, get_items_class
+    save_to_csv, make_selenium_get_request, get_items_class, scrape_product, scrape_products_parallel, \
+    xpath_to_css, get_items_urls_from_html, get_all_products_urls_http, parse_product_html, scrape_products_http, \
+    extract_item_fields, manipulate_menu_script, benchmark_menu, find_last_page, merge_pages_urls, \
+    get_all_products_urls_parallel, StreamingCsvWriter, main, open_page, wait_for_element, create_lean_options, \
+    get_browser_rss, benchmark_profiles, ManagedDriver, save_to_parquet, csv_to_parquet, \
+    cache_page, CachedPageDriver, replay_products, find_state_products, get_page_listing_items, \
+    complete_listing_items, run_queue_worker, run_coordinator, load_selectors, run_preflight, check_preflight, \
+    clean_dataframe, get_page_products_urls
+from checkpoint import CrawlState
+from delta import DeltaTracker, item_hash
+from metrics import METRICS, Metrics, MetricsExporter
+from page_cache import PageCache
+from rate_limiter import RateLimiter
+from work_queue import SqliteWorkQueue, WorkQueue, open_queue
+import main as main_module
+from standin import StandInSite, render_listing, render_product
+from benchmark import run_benchmark, benchmark_postprocessing, make_raw_products, clean_rows
+
+PRODUCT_HTML = """
+<div id="__layout"><div><main>
+  <div><div><div></div><div></div><div><a><div><div>4.7</div></div></a></div></div></div>
+  <article>
+    <div><div><form><div></div><div><div><div><div> 12 345 </div></div></div></div></form></div></div>
+    <div></div><div></div>
+    <div><div></div><div><div>
+      <div><div><div>
+        <button><div>ОПИСАНИЕ</div></button>
+        <button><div>ПРИМЕНЕНИЕ</div></button>
+        <button><div>О БРЕНДЕ</div></button>
+      </div></div></div>
+      <div><div><div><div><div><div> Eau Fraiche </div></div></div></div></div></div>
+    </div></div></div>
+  </article>
+  <div class="G5-4J">Описание\nтовара</div>
+  <div class="G5-4J">Нанести на кожу</div>
+  <div class="G4xy5"> Франция </div>
+</main></div></div>
+"""
 
 
 class TestMakeSeleniumGetRequest(unittest.TestCase):
@@ -82,6 +125,70 @@ class TestGetAllProductsUrls(unittest.TestCase):
         result = get_all_products_urls(fake_driver, 1, 1)
         self.assertEqual(result, ["https://goldapple.ru/product1", "https://goldapple.ru/product2"])
 
+    @patch('main.make_selenium_get_request')
+    @patch('main.get_items_class')
+    @patch('main.get_items_urls_on_page')
+    def test_get_all_products_urls_stops_on_empty_page(self, mock_get_items_urls, mock_get_items_class,
+                                                       mock_make_selenium_get_request):
+        """Проверяет, что без end_page обход останавливается на первой пустой странице, а дубли отбрасываются."""
+
+        mock_get_items_urls.side_effect = [["/product1", "/product2"], ["/product2", "/product3"], [], ["/product4"]]
+
+        result = get_all_products_urls(Mock(), 1)
+
+        self.assertEqual(result, ["/product1", "/product2", "/product3"])
+        self.assertEqual(mock_make_selenium_get_request.call_count, 3)
+
+    @patch('main.open_page', return_value=False)
+    def test_failed_page_is_not_end_of_catalog(self, mock_open_page):
+        """Проверяет, что пустая страница завершает каталог, а незагрузившаяся повторяется и вызывает ошибку."""
+
+        driver = Mock()
+        driver.find_elements.return_value = [Mock()]
+        with patch('main.get_items_class', return_value=[]):
+            self.assertEqual(get_page_products_urls(driver, 3), [])
+        self.assertEqual(mock_open_page.call_count, 1)
+
+        driver.find_elements.return_value = []
+        with self.assertRaises(TimeoutException):
+            get_all_products_urls(driver, 1)
+        self.assertEqual(mock_open_page.call_count, 1 + main_module.LISTING_ATTEMPTS)
+
+
+class TestFindLastPage(unittest.TestCase):
+    def test_find_last_page(self):
+        """Проверяет поиск последней непустой страницы и число обращений к сайту."""
+
+        for last_page in (0, 1, 2, 7, 414):
+            calls = []
+
+            def has_items(page):
+                calls.append(page)
+                return page <= last_page
+
+            self.assertEqual(find_last_page(has_items), last_page)
+            self.assertLessEqual(len(calls), 20)
+
+    def test_merge_pages_urls(self):
+        """Проверяет, что URL объединяются без повторов до первой пустой страницы."""
+
+        self.assertEqual(merge_pages_urls([["/a", "/b"], ["/b", "/c"], [], ["/d"]]), ["/a", "/b", "/c"])
+
+
+class TestGetAllProductsUrlsParallel(unittest.TestCase):
+    @patch('main.get_page_products_urls')
+    def test_get_all_products_urls_parallel(self, mock_get_page_products_urls):
+        """Проверяет, что страницы, загруженные при поиске последней, не запрашиваются повторно."""
+
+        mock_get_page_products_urls.side_effect = \
+            lambda driver, page, limiter: [f"/product{page}", "/common"] if page <= 5 else []
+
+        result = get_all_products_urls_parallel(workers=2, driver_factory=Mock)
+
+        self.assertEqual(result, ["/product1", "/common", "/product2", "/product3", "/product4", "/product5"])
+        requested_pages = [call.args[1] for call in mock_get_page_products_urls.call_args_list]
+        self.assertEqual(sorted(requested_pages), sorted(set(requested_pages)))
+
 
 class TestGetItemName(unittest.TestCase):
     def test_get_item_name(self):
@@ -196,6 +303,40 @@ class TestManipulateMenu(unittest.TestCase):
         self.assertEqual(p_item_country, "Not available")
 
 
+class TestManipulateMenuScript(unittest.TestCase):
+    def test_manipulate_menu_script(self):
+        """Проверяет, что вкладки открываются одним вызовом скрипта, а результат приводится к виду manipulate_menu."""
+
+        fake_driver = MagicMock()
+        fake_driver.execute_async_script.return_value = {"ПРИМЕНЕНИЕ": "Нанести\nна кожу ", "О БРЕНДЕ": " Франция "}
+
+        p_item_instructions, p_item_country = manipulate_menu_script(fake_driver)
+
+        fake_driver.execute_async_script.assert_called_once()
+        fake_driver.find_element.assert_not_called()
+        self.assertEqual(p_item_instructions, "Нанестина кожу")
+        self.assertEqual(p_item_country, "Франция")
+
+    def test_manipulate_menu_script_not_found(self):
+        """Проверяет, что отсутствующие вкладки заменяются на "Not available"."""
+
+        fake_driver = MagicMock()
+        fake_driver.execute_async_script.return_value = {}
+
+        self.assertEqual(manipulate_menu_script(fake_driver), ("Not available", "Not available"))
+
+    def test_benchmark_menu(self):
+        """Проверяет, что benchmark_menu возвращает среднее время вызова для обоих способов."""
+
+        fake_driver = MagicMock()
+        fake_driver.execute_async_script.return_value = {}
+
+        result = benchmark_menu(["https://goldapple.ru/product1"], driver_factory=lambda: fake_driver)
+
+        self.assertEqual(set(result), {"manipulate_menu", "manipulate_menu_script"})
+        fake_driver.quit.assert_called_once()
+
+
 class TestCreateItemDict(unittest.TestCase):
     def test_create_item_dict_with_rating_as_float(self):
         """Тестирование создания словаря товара с рейтингом в виде числа с плавающей точкой."""
@@ -267,5 +408,1240 @@ class TestSaveToCsv(unittest.TestCase):
         os.remove(test_path)
 
 
+class TestScrapeProduct(unittest.TestCase):
+    @patch('main.manipulate_menu', return_value=("Instructions", "Country"))
+    @patch('main.get_item_description', return_value="Description")
+    @patch('main.get_item_rating', return_value=4.5)
+    @patch('main.get_item_price', return_value="12 345")
+    @patch('main.get_item_name', return_value="Product")
+    def test_scrape_product(self, *mocks):
+        """Проверяет, что scrape_product открывает страницу и собирает словарь товара."""
+
+        fake_driver = Mock()
+        item = scrape_product("https://goldapple.ru/product1", fake_driver, 7)
+
+        fake_driver.get.assert_called_once_with("https://goldapple.ru/product1")
+        self.assertEqual(item, create_item_dict(7, "https://goldapple.ru/product1", "Product", "12 345", 4.5,
+                                                "Description", "Instructions", "Country"))
+
+
+class TestScrapeProductsParallel(unittest.TestCase):
+    @patch('main.scrape_product')
+    def test_scrape_products_parallel_keeps_order(self, mock_scrape_product):
+        """
+        Проверяет, что пул браузеров обрабатывает все URL, создает драйвер на каждый поток,
+        закрывает их и возвращает товары в порядке number.
+        """
+
+        mock_scrape_product.side_effect = lambda url, driver, number, limiter, **kwargs: {"number": number, "link": url}
+        drivers = []
+
+        def driver_factory():
+            driver = Mock()
+            drivers.append(driver)
+            return driver
+
+        urls = [f"https://goldapple.ru/product{i}" for i in range(1, 11)]
+        result = scrape_products_parallel(urls, workers=3, driver_factory=driver_factory)
+
+        self.assertEqual([item["number"] for item in result], list(range(1, 11)))
+        self.assertEqual([item["link"] for item in result], urls)
+        self.assertEqual(len(drivers), 3)
+        for driver in drivers:
+            driver.quit.assert_called_once()
+
+
+class TestExtractItemFields(unittest.TestCase):
+    def test_extract_item_fields(self):
+        """Проверяет, что поля товара извлекаются из одного снимка page_source."""
+
+        self.assertEqual(extract_item_fields(PRODUCT_HTML), {
+            "name": "Eau Fraiche", "price": "12 345", "rating": 4.7, "description": "Описаниетовара"
+        })
+
+    def test_extract_item_fields_not_available(self):
+        """Проверяет, что отсутствующие поля заменяются на "Not available"."""
+
+        self.assertEqual(set(extract_item_fields("<div id='__layout'></div>").values()), {"Not available"})
+
+    @patch('main.manipulate_menu', return_value=("Instructions", "Country"))
+    def test_scrape_product_snapshot(self, mock_manipulate_menu):
+        """Проверяет, что в режиме snapshot драйвер не опрашивается отдельно по каждому полю."""
+
+        fake_driver = Mock()
+        fake_driver.page_source = PRODUCT_HTML
+        item = scrape_product("https://goldapple.ru/product1", fake_driver, 1, snapshot=True)
+
+        # единственный поиск элемента - ожидание загрузки страницы
+        self.assertEqual(fake_driver.find_element.call_count, 1)
+        self.assertEqual(item["name"], "Eau Fraiche")
+        self.assertEqual(item["country"], "Country")
+
+
+class TestTypedOutput(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.dataframe = get_dataframe([
+            create_item_dict(1, "/p1", "Product 1", "12 345", 4.5, "Description", "Instructions", " Франция "),
+            create_item_dict(2, "/p2", "Product 2", "Not available", "Not available", "Not available",
+                             "Not available", "Not available"),
+            create_item_dict(3, "/p3", "Product 3", "1\u00a0200 ₽", 3.0, "Description", "Instructions", "Франция"),
+        ])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_typed_fields(self):
+        """Проверяет приведение цены, рейтинга и страны к типам и замену "Not available" на пропуски."""
+
+        typed = clean_dataframe(self.dataframe)
+
+        self.assertEqual(str(typed["price"].dtype), "Int32")
+        self.assertEqual(str(typed["rating"].dtype), "Float32")
+        self.assertEqual(str(typed["country"].dtype), "category")
+        self.assertEqual(typed["price"].tolist(), [12345, pd.NA, 1200])
+        self.assertTrue(pd.isna(typed.loc[1, "rating"]))
+        self.assertEqual(list(typed["country"].cat.categories), ["Франция"])
+        self.assertTrue(typed.loc[1, ["description", "instructions", "country"]].isna().all())
+
+    def test_save_to_parquet_and_csv_to_parquet(self):
+        """Проверяет, что Parquet из DataFrame и потоковое преобразование CSV дают одинаковые таблицы."""
+
+        parquet_path = os.path.join(self.directory.name, "products.parquet")
+        converted_path = os.path.join(self.directory.name, "converted.parquet")
+        csv_path = os.path.join(self.directory.name, "products.csv")
+
+        save_to_parquet(self.dataframe, parquet_path)
+        save_to_csv(self.dataframe, csv_path)
+        csv_to_parquet(csv_path, converted_path, chunksize=2)
+
+        self.assertTrue(pq.read_table(parquet_path).equals(pq.read_table(converted_path)))
+        self.assertEqual(pq.read_table(parquet_path).schema.field("price").type, "int32")
+
+
+class TestStreamingCsvWriter(unittest.TestCase):
+    def setUp(self):
+        self.items = [create_item_dict(number, f"/product{number}", f"Product {number}", "12 345",
+                                       4.5 if number % 2 else "Not available", "Описание, с запятой", "", "Франция")
+                      for number in range(1, 8)]
+
+    def tearDown(self):
+        for path in ("test_stream.csv", "test_stream.csv.part", "test_expected.csv"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_streaming_csv_writer_matches_save_to_csv(self):
+        """Проверяет, что потоковая запись товаров не по порядку дает тот же файл, что и save_to_csv."""
+
+        save_to_csv(get_dataframe(self.items), "test_expected.csv")
+
+        with StreamingCsvWriter("test_stream.csv", flush_every=2, fsync_every=3) as writer:
+            for item in self.items[2::-1] + self.items[3:]:
+                writer.write(item)
+            self.assertFalse(os.path.exists("test_stream.csv"))
+
+        with open("test_stream.csv", encoding="utf-8") as result:
+            with open("test_expected.csv", encoding="utf-8") as expected:
+                self.assertEqual(result.read(), expected.read())
+        self.assertFalse(os.path.exists("test_stream.csv.part"))
+
+    def test_streaming_csv_writer_keeps_part_file_on_error(self):
+        """Проверяет, что при сбое собранные товары остаются во временном файле."""
+
+        with self.assertRaises(RuntimeError):
+            with StreamingCsvWriter("test_stream.csv", flush_every=100) as writer:
+                for item in self.items[:3]:
+                    writer.write(item)
+                raise RuntimeError
+
+        self.assertFalse(os.path.exists("test_stream.csv"))
+        self.assertEqual(len(pd.read_csv("test_stream.csv.part")), 3)
+
+    def test_streaming_csv_writer_skip(self):
+        """Проверяет, что пропущенный номер не задерживает запись следующих товаров."""
+
+        with StreamingCsvWriter("test_stream.csv", flush_every=1) as writer:
+            writer.write(self.items[0])
+            writer.write(self.items[2])
+            self.assertEqual(writer.written, 1)
+            writer.skip(2)
+            self.assertEqual(writer.written, 2)
+
+        self.assertEqual(list(pd.read_csv("test_stream.csv")["number"]), [1, 3])
+
+    def test_streaming_csv_writer_unordered(self):
+        """Проверяет, что при ordered=False товары с пропусками в номерах записываются сразу, без буфера."""
+
+        numbers = [1, 2] + list(range(4, 2001))
+        with StreamingCsvWriter("test_stream.csv", ordered=False) as writer:
+            for number in numbers:
+                writer.write(create_item_dict(number, f"/product{number}", f"Product {number}"))
+            self.assertEqual(writer.pending, {})
+            self.assertGreaterEqual(writer.written, len(numbers) - writer.flush_every)
+
+        self.assertEqual(list(pd.read_csv("test_stream.csv")["number"]), numbers)
+
+    def test_streaming_csv_writer_without_items(self):
+        """Проверяет, что выгрузка без товаров содержит заголовок и преобразуется в Parquet."""
+
+        with StreamingCsvWriter("test_stream.csv"):
+            pass
+        save_to_csv(get_dataframe(self.items[:1]), "test_expected.csv")
+
+        with open("test_stream.csv", encoding="utf-8") as result:
+            with open("test_expected.csv", encoding="utf-8") as expected:
+                self.assertEqual(result.read(), expected.readline())
+        with tempfile.TemporaryDirectory() as directory:
+            parquet_path = os.path.join(directory, "products.parquet")
+            csv_to_parquet("test_stream.csv", parquet_path)
+            self.assertEqual(pq.read_table(parquet_path).num_rows, 0)
+
+
+class TestCrawlState(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state = CrawlState(os.path.join(self.directory.name, "state.sqlite3"))
+
+    def tearDown(self):
+        self.state.close()
+        self.directory.cleanup()
+
+    def test_crawl_state(self):
+        """Проверяет учет статусов товаров, числа попыток и сохранение собранных данных."""
+
+        self.assertFalse(self.state.is_listing_complete())
+        self.state.add_products(["/p1", "/p2", "/p3", "/p1"])
+        self.assertTrue(self.state.is_listing_complete())
+        self.assertEqual(self.state.pending_products(), [(1, "/p1"), (2, "/p2"), (3, "/p3")])
+
+        self.state.mark_done(create_item_dict(1, "/p1", "Product 1", "100", 4.5))
+        self.state.mark_failed("/p2", WebDriverException("session deleted"))
+        self.assertEqual(self.state.pending_products(), [(2, "/p2"), (3, "/p3")])
+        self.assertEqual(self.state.pending_products(max_attempts=1), [(3, "/p3")])
+        self.assertEqual(self.state.counts(), {"done": 1, "failed": 1, "pending": 1})
+        self.assertEqual(list(self.state.done_items()), [create_item_dict(1, "/p1", "Product 1", "100", 4.5)])
+
+        self.state.reset()
+        self.assertFalse(self.state.is_listing_complete())
+        self.assertEqual(self.state.pending_products(), [])
+
+
+class TestMainResume(unittest.TestCase):
+    @patch('main.wd.Firefox', side_effect=lambda options: Mock())
+    @patch('main.get_all_products_urls', return_value=["/p1", "/p2", "/p3"])
+    @patch('main.scrape_product')
+    def test_main_resume(self, mock_scrape_product, mock_get_all_products_urls, mock_firefox):
+        """
+        Проверяет, что после сбоя на одном товаре повторный запуск с resume=True не обходит каталог заново,
+        обрабатывает только товар с ошибкой и сохраняет в CSV все товары.
+        """
+
+        def scrape(url, driver, number, limiter, **kwargs):
+            if url == "/p2" and mock_scrape_product.call_count <= 3:
+                raise WebDriverException("session deleted")
+            return create_item_dict(number, url, f"Product {number}")
+
+        mock_scrape_product.side_effect = scrape
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, "products.csv")
+            with patch('main.STATE_PATH', os.path.join(directory, "state.sqlite3")), patch('main.CSV_PATH', csv_path):
+                main()
+                self.assertEqual(list(pd.read_csv(csv_path)["link"]), ["/p1", "/p3"])
+
+                main(resume=True)
+                self.assertEqual(list(pd.read_csv(csv_path)["link"]), ["/p1", "/p2", "/p3"])
+
+        mock_get_all_products_urls.assert_called_once()
+        self.assertEqual([call.args[0] for call in mock_scrape_product.call_args_list], ["/p1", "/p2", "/p3", "/p2"])
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_reserve(self):
+        """Проверяет, что запросы сверх запаса токенов ожидают в порядке очереди."""
+
+        limiter = RateLimiter(max_rate=10, burst=1)
+
+        self.assertEqual(limiter.reserve(), 0)
+        self.assertAlmostEqual(limiter.reserve(), 0.1, places=2)
+        self.assertAlmostEqual(limiter.reserve(), 0.2, places=2)
+
+    def test_rate_per_worker(self):
+        """Проверяет, что общий ограничитель для N потоков выдает в N раз больше токенов за то же время."""
+
+        for workers in (1, 4):
+            limiter = RateLimiter(max_rate=10, burst=1, workers=workers)
+            waits = [limiter.reserve() for _ in range(20 * workers)]
+
+            self.assertEqual(waits[:workers], [0] * workers)
+            self.assertAlmostEqual(waits[-1], (20 * workers - workers) / (10 * workers), places=2)
+            self.assertEqual(limiter.max_rate, 10 * workers)
+
+    def test_record_aimd(self):
+        """Проверяет аддитивное увеличение скорости после быстрых ответов и кратное снижение после ошибок."""
+
+        limiter = RateLimiter(max_rate=2, min_rate=0.5, increase=0.25, decrease=0.5, slow_threshold=5)
+
+        limiter.record(10)
+        self.assertEqual(limiter.rate, 1)
+        limiter.record(0.5, ok=False)
+        limiter.record(0.5, ok=False)
+        self.assertEqual(limiter.rate, 0.5)
+        limiter.record(0.5)
+        self.assertEqual(limiter.rate, 0.75)
+        for _ in range(10):
+            limiter.record(0.5)
+        self.assertEqual(limiter.rate, 2)
+
+
+class TestOpenPage(unittest.TestCase):
+    def test_open_page(self):
+        """Проверяет, что страница открывается после разрешения limiter, а результат ожидания передается в него."""
+
+        fake_driver = Mock()
+        limiter = Mock()
+
+        self.assertTrue(open_page("https://goldapple.ru/product1", fake_driver, ("xpath", "//div"), limiter))
+
+        limiter.acquire.assert_called_once()
+        fake_driver.get.assert_called_once_with("https://goldapple.ru/product1")
+        self.assertTrue(limiter.record.call_args.kwargs["ok"])
+
+    def test_wait_for_element_timeout(self):
+        """Проверяет, что при отсутствии элемента ожидание завершается по таймауту без исключения."""
+
+        fake_driver = Mock()
+        fake_driver.find_element.side_effect = NoSuchElementException
+
+        self.assertFalse(wait_for_element(fake_driver, ("xpath", "//div"), timeout=0.2))
+
+
+class TestLeanProfile(unittest.TestCase):
+    def test_create_lean_options(self):
+        """Проверяет настройки облегченного профиля браузера."""
+
+        lean_opts = create_lean_options(blocked_hosts=["mc.yandex.ru"])
+
+        self.assertIn("-headless", lean_opts.arguments)
+        self.assertEqual(lean_opts.page_load_strategy, "eager")
+        self.assertEqual(lean_opts.preferences["permissions.default.image"], 2)
+        self.assertFalse(lean_opts.preferences["gfx.downloadable_fonts.enabled"])
+        self.assertEqual(lean_opts.preferences["network.proxy.type"], 2)
+        self.assertIn("mc.yandex.ru", lean_opts.preferences["network.proxy.autoconfig_url"])
+
+        self.assertNotIn("network.proxy.type", create_lean_options(blocked_hosts=[]).preferences)
+
+    def test_get_browser_rss(self):
+        """Проверяет подсчет памяти процессов браузера по идентификатору процесса из capabilities."""
+
+        fake_driver = Mock()
+        fake_driver.capabilities = {"moz:processID": os.getpid()}
+        self.assertGreater(get_browser_rss(fake_driver), 0)
+
+        fake_driver.capabilities = {}
+        self.assertEqual(get_browser_rss(fake_driver), 0)
+
+    def test_benchmark_profiles(self):
+        """Проверяет, что оба профиля запускаются, а для каждого возвращаются время и память."""
+
+        profiles = []
+
+        def driver_factory(lean):
+            profiles.append(lean)
+            return MagicMock(capabilities={})
+
+        result = benchmark_profiles(["https://goldapple.ru/product1"], driver_factory=driver_factory)
+
+        self.assertEqual(profiles, [False, True])
+        self.assertEqual(set(result), {"default", "lean"})
+        self.assertEqual(set(result["lean"]), {"seconds_per_page", "peak_rss_mb"})
+
+
+class TestManagedDriver(unittest.TestCase):
+    def setUp(self):
+        self.drivers = []
+
+    def driver_factory(self):
+        driver = MagicMock()
+        self.drivers.append(driver)
+        return driver
+
+    def test_restart_every_n_pages(self):
+        """Проверяет, что браузер перезапускается после заданного числа страниц."""
+
+        driver = ManagedDriver(self.driver_factory, max_pages=2, max_rss_mb=None)
+        for page in range(5):
+            driver.get(f"https://goldapple.ru/product{page}")
+
+        self.assertEqual(len(self.drivers), 3)
+        self.assertEqual(driver.restarts, 2)
+        self.drivers[0].quit.assert_called_once()
+
+    @patch('main.get_browser_rss', return_value=2 * 2 ** 30)
+    def test_restart_on_memory_limit(self, mock_get_browser_rss):
+        """Проверяет, что браузер перезапускается при превышении порога памяти."""
+
+        driver = ManagedDriver(self.driver_factory, max_pages=None, max_rss_mb=1024, rss_check_every=3)
+        for page in range(4):
+            driver.get(f"https://goldapple.ru/product{page}")
+
+        self.assertEqual(len(self.drivers), 2)
+        mock_get_browser_rss.assert_called_once()
+
+    def test_dead_session_is_rebuilt(self):
+        """Проверяет, что при завершившейся сессии браузер пересоздается, а текущая страница открывается заново."""
+
+        driver = ManagedDriver(self.driver_factory, max_pages=None, max_rss_mb=None)
+        driver.get("https://goldapple.ru/product1")
+
+        dead_driver = self.drivers[0]
+        dead_driver.find_element.side_effect = WebDriverException("session deleted")
+        type(dead_driver).current_url = property(Mock(side_effect=WebDriverException("session deleted")))
+
+        element = driver.find_element("xpath", "//div")
+
+        self.assertEqual(len(self.drivers), 2)
+        self.drivers[1].get.assert_called_once_with("https://goldapple.ru/product1")
+        self.assertIs(element, self.drivers[1].find_element.return_value)
+
+    def test_dead_session_during_get(self):
+        """Проверяет, что при завершении сессии во время открытия страницы она загружается в новом браузере один раз."""
+
+        driver = ManagedDriver(self.driver_factory, max_pages=None, max_rss_mb=None)
+        dead_driver = self.drivers[0]
+        dead_driver.get.side_effect = WebDriverException("session deleted")
+        type(dead_driver).current_url = property(Mock(side_effect=WebDriverException("session deleted")))
+
+        driver.get("https://goldapple.ru/product1")
+
+        self.assertEqual(len(self.drivers), 2)
+        self.drivers[1].get.assert_called_once_with("https://goldapple.ru/product1")
+        self.assertEqual(driver.pages, 1)
+
+    def test_live_session_error_is_raised(self):
+        """Проверяет, что ошибки при работающей сессии передаются вызывающему коду без перезапуска."""
+
+        driver = ManagedDriver(self.driver_factory)
+        self.drivers[0].find_element.side_effect = NoSuchElementException
+
+        with self.assertRaises(NoSuchElementException):
+            driver.find_element("xpath", "//div")
+        self.assertEqual(len(self.drivers), 1)
+
+        self.drivers[0].execute_async_script.side_effect = WebDriverException("javascript error")
+        with self.assertRaises(WebDriverException):
+            driver.execute_async_script("return 1")
+        self.assertEqual(len(self.drivers), 1)
+
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_put_and_get(self):
+        """Проверяет сохранение страниц по URL и дате и хранение одинакового содержимого в одном файле."""
+
+        with PageCache(self.directory.name) as cache:
+            first = cache.put("/p1", b"<html>1</html>", date="2024-01-01")
+            second = cache.put("/p2", b"<html>1</html>", date="2024-01-01")
+            cache.put("/p1", b"<html>2</html>", date="2024-01-02")
+
+            self.assertEqual(first, second)
+            self.assertEqual(cache.get("/p1"), b"<html>2</html>")
+            self.assertEqual(cache.get("/p1", date="2024-01-01"), b"<html>1</html>")
+            self.assertIsNone(cache.get("/p3"))
+            self.assertEqual(cache.urls(), ["/p1", "/p2"])
+            self.assertEqual(cache.urls(date="2024-01-02"), ["/p1"])
+
+        with PageCache(self.directory.name) as cache:
+            self.assertEqual(cache.get("/p2"), b"<html>1</html>")
+
+    def test_evict_least_recently_used(self):
+        """Проверяет, что при превышении размера удаляются страницы, к которым дольше всего не обращались."""
+
+        with PageCache(self.directory.name) as cache:
+            for number in range(3):
+                cache.put(f"/p{number}", os.urandom(1000))
+            cache.max_size = cache.size
+            cache.get("/p0")
+            cache.put("/p3", os.urandom(1000))
+
+            self.assertIsNotNone(cache.get("/p0"))
+            self.assertIsNone(cache.get("/p1"))
+            self.assertLessEqual(cache.size, cache.max_size)
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.tabs = [PRODUCT_HTML, PRODUCT_HTML.replace("Описание\nтовара", "Нанести на кожу"), PRODUCT_HTML]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_cached_page_driver(self):
+        """Проверяет, что функции разбора работают со страницей из кеша так же, как с браузером."""
+
+        driver = CachedPageDriver("https://goldapple.ru/product1", PRODUCT_HTML, self.tabs)
+
+        self.assertEqual(get_item_name(driver), "Eau Fraiche")
+        self.assertEqual(get_item_price(driver), "12 345")
+        self.assertEqual(get_item_rating(driver), 4.7)
+        self.assertEqual(get_item_description(driver), "Описаниетовара")
+        self.assertEqual(manipulate_menu(driver), ("Нанести на кожу", "Франция"))
+
+    def test_replay_products(self):
+        """Проверяет повторный разбор страниц, сохраненных браузером и HTTP-клиентом."""
+
+        with PageCache(self.directory.name) as cache:
+            cache_page(cache, "https://goldapple.ru/product1", PRODUCT_HTML, self.tabs)
+            cache_page(cache, "https://goldapple.ru/product2", "<div id='app'></div>", source="http")
+            cache_page(cache, "https://goldapple.ru/product3", PRODUCT_HTML, source="http")
+
+            items = list(replay_products(cache))
+
+        self.assertEqual([item["number"] for item in items], [1, 2])
+        self.assertEqual(items[0], create_item_dict(1, "https://goldapple.ru/product1", "Eau Fraiche", "12 345", 4.7,
+                                                    "Описаниетовара", "Нанести на кожу", "Франция"))
+        self.assertEqual(items[1]["link"], "https://goldapple.ru/product3")
+
+    @patch('main.open_page')
+    def test_scrape_product_saves_page_to_cache(self, mock_open_page):
+        """Проверяет, что при обходе с кешем сохраняются страница и снимки вкладок."""
+
+        fake_driver = MagicMock()
+        fake_driver.page_source = PRODUCT_HTML
+        fake_driver.execute_async_script.return_value = self.tabs
+
+        with PageCache(self.directory.name) as cache:
+            scrape_product("https://goldapple.ru/product1", fake_driver, 1, snapshot=True, cache=cache)
+            items = list(replay_products(cache))
+
+        self.assertEqual(items[0]["instructions"], "Нанести на кожу")
+
+
+class TestXpathToCss(unittest.TestCase):
+    def test_xpath_to_css(self):
+        """Проверяет преобразование абсолютного XPath в CSS-селектор."""
+
+        self.assertEqual(xpath_to_css('//*[@id="__layout"]/div/main/article/div[4]/button[2]/div'),
+                         '#__layout > div > main > article > div:nth-of-type(4) > button:nth-of-type(2) > div')
+
+
+class TestParseProductHtml(unittest.TestCase):
+    def test_parse_product_html(self):
+        """Проверяет, что поля товара извлекаются из HTML так же, как из браузера."""
+
+        item = parse_product_html(PRODUCT_HTML, "https://goldapple.ru/product1", 3)
+
+        self.assertEqual(item, create_item_dict(3, "https://goldapple.ru/product1", "Eau Fraiche", "12 345", 4.7,
+                                                "Описаниетовара", "Нанести на кожу", "Франция"))
+
+    def test_parse_product_html_requires_javascript(self):
+        """Проверяет, что страница без серверной разметки или без содержимого вкладок требует браузер."""
+
+        self.assertIsNone(parse_product_html("<div id='app'></div>", "https://goldapple.ru/product1", 1))
+        self.assertIsNone(parse_product_html(PRODUCT_HTML.replace('class="G4xy5"', ''),
+                                             "https://goldapple.ru/product1", 1))
+
+    def test_parse_product_html_untied_instructions(self):
+        """Проверяет, что применение, которое нельзя связать с вкладкой по числу блоков, оставляется браузеру."""
+
+        extra_block = PRODUCT_HTML.replace('<div class="G4xy5">', '<div class="G5-4J">Состав</div><div class="G4xy5">')
+        self.assertIsNone(parse_product_html(extra_block, "https://goldapple.ru/product1", 1))
+        self.assertIsNone(parse_product_html(PRODUCT_HTML.replace('<div class="G5-4J">Нанести на кожу</div>', ''),
+                                             "https://goldapple.ru/product1", 1))
+
+
+class TestHttpEngine(unittest.TestCase):
+    def test_get_items_urls_from_html(self):
+        """Проверяет извлечение ссылок на товары из HTML страницы каталога."""
+
+        html = """
+        <div class="Wqob-"><article><a href="/product1">1</a></article></div>
+        <div class="Wqob-"><span>без ссылки</span></div>
+        <div class="Wqob-"><article><a href="https://goldapple.ru/product2">2</a></article></div>
+        """
+        self.assertEqual(get_items_urls_from_html(html),
+                         ["https://goldapple.ru/product1", "https://goldapple.ru/product2"])
+
+    def test_get_all_products_urls_http(self):
+        """Проверяет загрузку страниц каталога через httpx с локальной заглушкой транспорта."""
+
+        def handler(request):
+            page = request.url.params["p"]
+            return httpx.Response(200, text=f'<div class="Wqob-"><article><a href="/p{page}">x</a></article></div>')
+
+        result = get_all_products_urls_http(1, 3, transport=httpx.MockTransport(handler))
+        self.assertEqual(result, ["https://goldapple.ru/p1", "https://goldapple.ru/p2", "https://goldapple.ru/p3"])
+
+    def test_get_all_products_urls_http_finds_last_page(self):
+        """Проверяет, что без end_page количество страниц каталога определяется автоматически."""
+
+        def handler(request):
+            page = int(request.url.params["p"])
+            if page > 6:
+                return httpx.Response(200, text="<div></div>")
+            return httpx.Response(200, text=f'<div class="Wqob-"><article><a href="/p{page}">x</a></article></div>')
+
+        result = get_all_products_urls_http(transport=httpx.MockTransport(handler))
+        self.assertEqual(result, [f"https://goldapple.ru/p{page}" for page in range(1, 7)])
+
+    def test_get_all_products_urls_http_retries_failed_pages(self):
+        """Проверяет, что ошибка загрузки страницы каталога повторяется, а не принимается за конец каталога."""
+
+        requests: dict = {}
+
+        def handler(request):
+            page = int(request.url.params["p"])
+            requests[page] = requests.get(page, 0) + 1
+            if page in failing_pages and requests[page] <= failures:
+                return httpx.Response(503)
+            if page > 6:
+                return httpx.Response(200, text="<div></div>")
+            return httpx.Response(200, text=f'<div class="Wqob-"><article><a href="/p{page}">x</a></article></div>')
+
+        failing_pages, failures = {2, 3}, 1
+        result = get_all_products_urls_http(transport=httpx.MockTransport(handler))
+        self.assertEqual(result, [f"https://goldapple.ru/p{page}" for page in range(1, 7)])
+
+        requests.clear()
+        failing_pages, failures = {3}, main_module.LISTING_ATTEMPTS
+        with self.assertRaises(RuntimeError):
+            get_all_products_urls_http(1, 6, transport=httpx.MockTransport(handler))
+        self.assertEqual(requests[3], main_module.LISTING_ATTEMPTS)
+
+    @patch('main.scrape_product')
+    def test_scrape_products_http_falls_back_to_selenium(self, mock_scrape_product):
+        """Проверяет, что страницы без серверной разметки и с ошибками загрузки обрабатываются через Selenium."""
+
+        def handler(request):
+            if request.url.path == "/product1":
+                return httpx.Response(200, text=PRODUCT_HTML)
+            if request.url.path == "/product2":
+                return httpx.Response(200, text="<div id='app'></div>")
+            return httpx.Response(503)
+
+        mock_scrape_product.side_effect = lambda url, driver, number, limiter, **kwargs: {"number": number, "link": url}
+        fake_driver = Mock()
+        urls = ["https://goldapple.ru/product1", "https://goldapple.ru/product2", "https://goldapple.ru/product3"]
+
+        result = scrape_products_http(urls, driver_factory=lambda: fake_driver,
+                                      transport=httpx.MockTransport(handler))
+
+        self.assertEqual([item["link"] for item in result], urls)
+        self.assertEqual(result[0]["name"], "Eau Fraiche")
+        self.assertEqual(mock_scrape_product.call_count, 2)
+        fake_driver.quit.assert_called_once()
+
+    @patch('main.scrape_product')
+    def test_scrape_products_http_streams_chunks(self, mock_scrape_product):
+        """Проверяет, что товары передаются в on_item по мере готовности, а браузер дообрабатывает каждую часть."""
+
+        def handler(request):
+            if request.url.path in ("/product2", "/product5"):
+                return httpx.Response(503)
+            return httpx.Response(200, text=PRODUCT_HTML)
+
+        mock_scrape_product.side_effect = lambda url, driver, number, limiter, **kwargs: {"number": number, "link": url}
+        urls = [f"https://goldapple.ru/product{number}" for number in range(1, 7)]
+        received: list = []
+
+        result = scrape_products_http(urls, driver_factory=Mock, transport=httpx.MockTransport(handler),
+                                      on_item=lambda item: received.append(item["number"]), workers=2, chunk_size=3)
+
+        self.assertEqual(result, [])
+        self.assertEqual(sorted(received[:3]), [1, 2, 3])
+        self.assertEqual(sorted(received[3:]), [4, 5, 6])
+        self.assertEqual([call.args[2] for call in mock_scrape_product.call_args_list], [2, 5])
+
+    @patch('main.scrape_products_http', return_value=[])
+    @patch('main.get_all_products_urls_http', return_value=[])
+    def test_main_http_rate_limit(self, mock_get_all_products_urls_http, mock_scrape_products_http):
+        """Проверяет, что HTTP-клиент ограничивается http_rps, а браузеры для дообработки - rps на браузер."""
+
+        with tempfile.TemporaryDirectory() as directory, \
+                patch('main.STATE_PATH', os.path.join(directory, "state.sqlite3")), \
+                patch('main.CSV_PATH', os.path.join(directory, "products.csv")):
+            main(engine="http", workers=2, rps=0.5, http_rps=20)
+
+        http_limiter = mock_get_all_products_urls_http.call_args.kwargs["limiter"]
+        self.assertEqual(http_limiter.max_rate, 20)
+        self.assertIs(mock_scrape_products_http.call_args.kwargs["limiter"], http_limiter)
+        self.assertEqual(mock_scrape_products_http.call_args.kwargs["browser_limiter"].max_rate, 1.0)
+
+
+class TestStandInSite(unittest.TestCase):
+    def test_http_engine_on_stand_in_site(self):
+        """Проверяет, что разметка локального сайта разбирается теми же селекторами, что и настоящий сайт."""
+
+        with StandInSite(pages=2, per_page=3) as site, patch('main.URL', site.listing_url):
+            urls = get_all_products_urls_http()
+            items = scrape_products_http(urls, driver_factory=Mock(side_effect=AssertionError))
+
+        self.assertEqual(urls, [f"{site.url}/product-{number}" for number in range(1, 7)])
+        self.assertEqual([item["name"] for item in items], [f"Аромат {number}" for number in range(1, 7)])
+        self.assertRegex(items[0]["price"], r"^\d[\d ]* ₽$")
+        self.assertEqual(items[0]["instructions"], "Нанести на кожу. Товар 1.")
+        self.assertNotEqual(items[0]["country"], "Not available")
+
+    def test_listing_with_failures(self):
+        """Проверяет, что ошибки 503 на страницах каталога не сокращают список товаров."""
+
+        with StandInSite(pages=20, per_page=5, failure_rate=0.15) as site, patch('main.URL', site.listing_url), \
+                patch('main.LISTING_ATTEMPTS', 20):
+            urls = get_all_products_urls_http()
+
+        self.assertEqual(urls, [f"{site.url}/product-{number}" for number in range(1, 101)])
+
+    def test_failures_and_missing_pages(self):
+        """Проверяет ответы 503 с заданной долей ошибок и 404 для неизвестных страниц."""
+
+        with StandInSite(failure_rate=1.0) as site:
+            self.assertEqual(httpx.get(site.listing_url).status_code, 503)
+        with StandInSite() as site:
+            self.assertEqual(httpx.get(site.url + "/unknown").status_code, 404)
+            self.assertEqual(site.requests, 1)
+
+    def test_run_benchmark(self):
+        """Проверяет, что замер на локальном сайте возвращает все показатели."""
+
+        result = run_benchmark(pages=2, per_page=3, engine="http")
+
+        self.assertEqual((result["products"], result["expected_products"], result["complete"]), (6, 6, True))
+        for key in ("listing_pages_per_second", "products_per_second", "product_p50_seconds",
+                    "product_p95_seconds", "peak_rss_mb"):
+            self.assertGreater(result[key], 0)
+        self.assertLessEqual(result["product_p50_seconds"], result["product_p95_seconds"])
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counters_and_histograms(self):
+        """Проверяет подсчет событий и распределение наблюдений по интервалам гистограммы."""
+
+        metrics = Metrics(buckets=(0.1, 1.0))
+        metrics.inc("errors_total", field="name")
+        metrics.inc("errors_total", 2, field="name")
+        for seconds in (0.05, 0.5, 5.0):
+            metrics.observe("stage_seconds", seconds, stage="driver_get")
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"], [{"name": "errors_total", "labels": {"field": "name"}, "value": 3}])
+        histogram = snapshot["histograms"][0]
+        self.assertEqual((histogram["count"], histogram["sum"]), (3, 5.55))
+        self.assertEqual(histogram["buckets"], {0.1: 1, 1.0: 1})
+
+        text = metrics.to_prometheus()
+        self.assertIn('errors_total{field="name"} 3', text)
+        self.assertIn('stage_seconds_bucket{stage="driver_get",le="1.0"} 2', text)
+        self.assertIn('stage_seconds_bucket{stage="driver_get",le="+Inf"} 3', text)
+        self.assertIn('stage_seconds_count{stage="driver_get"} 3', text)
+
+    def test_timed(self):
+        """Проверяет, что декоратор записывает время выполнения и не меняет результат функции."""
+
+        metrics = Metrics()
+        function = metrics.timed("stage_seconds", stage="parse")(lambda value: value * 2)
+
+        self.assertEqual(function(21), 42)
+        self.assertEqual(metrics.snapshot()["histograms"][0]["count"], 1)
+
+    def test_field_fallbacks(self):
+        """Проверяет подсчет полей, которые не удалось найти на странице."""
+
+        driver = Mock()
+        driver.find_element.side_effect = NoSuchElementException
+        METRICS.reset()
+
+        get_item_name(driver)
+        get_item_price(driver)
+        manipulate_menu(driver)
+
+        counters = {counter["labels"].get("field"): counter["value"] for counter in METRICS.snapshot()["counters"]}
+        self.assertEqual(counters, {"name": 1, "price": 1, "instructions": 1, "country": 1})
+
+    def test_exporter(self):
+        """Проверяет выгрузку метрик в JSON Lines и в textfile Prometheus."""
+
+        metrics = Metrics()
+        metrics.inc("products_total")
+        with tempfile.TemporaryDirectory() as directory:
+            jsonl_path = os.path.join(directory, "metrics.jsonl")
+            prometheus_path = os.path.join(directory, "metrics.prom")
+            with MetricsExporter(jsonl_path, interval=0.01, metrics=metrics):
+                time.sleep(0.05)
+            with MetricsExporter(prometheus_path, "prometheus", interval=60, metrics=metrics):
+                pass
+
+            with open(jsonl_path, encoding="utf-8") as file:
+                lines = file.readlines()
+            self.assertGreater(len(lines), 1)
+            self.assertEqual(json.loads(lines[-1])["counters"][0]["value"], 1)
+            with open(prometheus_path, encoding="utf-8") as file:
+                self.assertIn("products_total 1", file.read())
+            self.assertFalse(os.path.exists(prometheus_path + ".tmp"))
+
+
+class TestDeltaTracker(unittest.TestCase):
+    def test_compare_with_previous_export(self):
+        """Проверяет журнал изменений относительно выгрузки, сохраненной StreamingCsvWriter."""
+
+        previous = [create_item_dict(1, "/p1", "A", "100 ₽", 4.5, "text"),
+                    create_item_dict(2, "/p2", "B", "200 ₽", "Not available", "text"),
+                    create_item_dict(3, "/p3", "C", "300 ₽", 5.0, "text")]
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, "products.csv")
+            changes_path = os.path.join(directory, "changes.csv")
+            with StreamingCsvWriter(csv_path) as writer:
+                for item in previous:
+                    writer.write(item)
+
+            with DeltaTracker(csv_path, changes_path) as tracker:
+                self.assertIsNone(tracker.compare(create_item_dict(7, "/p1", "A", "100 ₽", 4.5, "text")))
+                self.assertEqual(tracker.compare(create_item_dict(2, "/p2", "B", "250 ₽", "Not available", "text")),
+                                 "price_changed")
+                self.assertEqual(tracker.compare(create_item_dict(3, "/p4", "D", "400 ₽", 4.0, "text")), "added")
+                tracker.finish(["/p1", "/p2", "/p4"])
+            self.assertFalse(os.path.exists(changes_path + ".part"))
+
+            changes = pd.read_csv(changes_path)
+        self.assertEqual(list(changes["change"]), ["price_changed", "added", "removed"])
+        self.assertEqual(list(changes["link"]), ["/p2", "/p4", "/p3"])
+        self.assertEqual(changes["old_price"][0], "200 ₽")
+        self.assertEqual(tracker.counts, {"added": 1, "removed": 1, "price_changed": 1, "text_changed": 0})
+
+    def test_item_hash_ignores_number(self):
+        """Проверяет, что хеш зависит только от содержимого товара."""
+
+        self.assertEqual(item_hash(create_item_dict(1, "/a", "A", "1 ₽")),
+                         item_hash(create_item_dict(2, "/b", "A", "1 ₽")))
+        self.assertNotEqual(item_hash(create_item_dict(1, "/a", "A", "1 ₽")),
+                            item_hash(create_item_dict(1, "/a", "A", "1 ₽", description="new")))
+
+    @patch('main.wd.Firefox', side_effect=lambda options: Mock())
+    @patch('main.get_all_products_urls')
+    @patch('main.scrape_product')
+    def test_main_delta(self, mock_scrape_product, mock_get_all_products_urls, mock_firefox):
+        """Проверяет, что товар, завершившийся ошибкой, не попадает в журнал как удаленный."""
+
+        def scrape(url, driver, number, limiter, **kwargs):
+            if url == "/p3" and mock_get_all_products_urls.call_count == 2:
+                raise WebDriverException("session deleted")
+            description = "new" if url == "/p2" and mock_get_all_products_urls.call_count == 2 else "old"
+            return create_item_dict(number, url, url, "100 ₽", description=description)
+
+        mock_scrape_product.side_effect = scrape
+        with tempfile.TemporaryDirectory() as directory:
+            changes_path = os.path.join(directory, "changes.csv")
+            with patch('main.STATE_PATH', os.path.join(directory, "state.sqlite3")), \
+                    patch('main.CSV_PATH', os.path.join(directory, "products.csv")), \
+                    patch('main.CHANGES_PATH', changes_path):
+                mock_get_all_products_urls.return_value = ["/p1", "/p2", "/p3", "/p4"]
+                main(delta=True)
+                self.assertEqual(list(pd.read_csv(changes_path)["change"]), ["added"] * 4)
+
+                mock_get_all_products_urls.return_value = ["/p2", "/p3", "/p4", "/p5"]
+                main(delta=True)
+                changes = pd.read_csv(changes_path)
+
+        self.assertEqual(list(zip(changes["change"], changes["link"])),
+                         [("text_changed", "/p2"), ("added", "/p5"), ("removed", "/p1")])
+
+    @patch('main.wd.Firefox', side_effect=lambda options: Mock())
+    @patch('main.get_all_products_urls', return_value=["/p1", "/p2"])
+    @patch('main.scrape_product')
+    def test_delta_after_parquet_output(self, mock_scrape_product, mock_get_all_products_urls, mock_firefox):
+        """Проверяет, что после выгрузки только в Parquet следующий обход сравнивается с прежним CSV."""
+
+        mock_scrape_product.side_effect = lambda url, driver, number, limiter, **kwargs: create_item_dict(
+            number, url, url, "100 ₽")
+        with tempfile.TemporaryDirectory() as directory:
+            changes_path = os.path.join(directory, "changes.csv")
+            with patch('main.STATE_PATH', os.path.join(directory, "state.sqlite3")), \
+                    patch('main.CSV_PATH', os.path.join(directory, "products.csv")), \
+                    patch('main.PARQUET_PATH', os.path.join(directory, "products.parquet")), \
+                    patch('main.CHANGES_PATH', changes_path):
+                main(output="parquet")
+                self.assertEqual(pq.read_table(os.path.join(directory, "products.parquet")).num_rows, 2)
+                main(delta=True)
+                changes = pd.read_csv(changes_path)
+
+        self.assertTrue(changes.empty)
+
+
+class TestListingState(unittest.TestCase):
+    def test_find_state_products(self):
+        """Проверяет поиск товаров во вложенном состоянии Nuxt и приведение цены к виду страницы товара."""
+
+        state = {"data": [{"catalog": {"products": [
+            {"url": "/p1", "name": " A ", "price": {"amount": 12345, "currency": "RUB"}, "rating": 4.5},
+            {"url": "/p2", "title": "B", "price": "990 ₽", "description": "текст"},
+            {"url": "/p1", "name": "A", "price": 1},
+        ]}}], "menu": [{"url": "/brands", "name": "Бренды"}]}
+
+        self.assertEqual(find_state_products(state, "https://goldapple.ru/parfjumerija"), [
+            {"link": "https://goldapple.ru/p1", "name": "A", "price": "12 345 ₽", "rating": 4.5},
+            {"link": "https://goldapple.ru/p2", "name": "B", "price": "990 ₽", "rating": "Not available",
+             "description": "текст"},
+        ])
+
+    def test_get_page_listing_items(self):
+        """Проверяет извлечение товаров из состояния одним вызовом скрипта и переход к ссылкам без состояния."""
+
+        html = render_listing("http://shop", [1, 2]).decode("utf-8")
+        state = json.loads(html.split("window.__NUXT__ = ")[1].split(";\n")[0])
+        links = ["http://shop/product-1", "http://shop/product-2"]
+        driver = Mock()
+        driver.execute_script.return_value = json.dumps({"state": state, "links": links})
+
+        items = get_page_listing_items(driver, 1)
+
+        self.assertEqual([item["link"] for item in items], ["https://goldapple.ru/product-1",
+                                                             "https://goldapple.ru/product-2"])
+        self.assertRegex(items[0]["price"], r"^\d[\d ]* ₽$")
+        driver.execute_script.assert_called_once()
+
+        driver.execute_script.return_value = json.dumps({"state": None, "links": ["/p1"]})
+        self.assertEqual(get_page_listing_items(driver, 2), [{"link": "/p1"}])
+
+    def test_listing_items_outside_tiles(self):
+        """Проверяет, что товары из состояния без карточки на странице не попадают в каталог."""
+
+        state = {"catalog": [{"url": "/p1", "name": "A", "price": 1}],
+                 "recommendations": [{"url": "/promo", "name": "Promo", "price": 2}]}
+        driver = Mock()
+        driver.execute_script.return_value = json.dumps({"state": state, "links": ["https://goldapple.ru/p1"]})
+
+        self.assertEqual([item["link"] for item in get_page_listing_items(driver, 1)], ["https://goldapple.ru/p1"])
+
+    @patch('main.open_page', return_value=False)
+    @patch('main.is_page_rendered', return_value=True)
+    def test_listing_items_end_of_catalog(self, mock_is_page_rendered, mock_open_page):
+        """Проверяет, что страница без карточек завершает обход, даже если в состоянии есть товары."""
+
+        driver = Mock()
+        driver.execute_script.return_value = json.dumps(
+            {"state": {"promo": [{"url": "/promo", "name": "Promo", "price": 2}]}, "links": []})
+
+        self.assertEqual(get_page_listing_items(driver, 3), [])
+        driver.execute_script.assert_not_called()
+
+    def test_complete_listing_items(self):
+        """Проверяет, что товары без описания в предыдущей выгрузке остаются для обработки в браузере."""
+
+        listing_items = [{"link": "/p1", "name": "A", "price": "2 ₽", "rating": 4.0},
+                         {"link": "/p2", "name": "B", "price": "3 ₽", "rating": 5.0}]
+        previous = {"/p1": {"description": "d", "instructions": "i", "country": "Not available"}}
+
+        result = complete_listing_items(listing_items, previous, {"/p1": 1, "/p2": 2})
+
+        self.assertEqual(result, [create_item_dict(1, "/p1", "A", "2 ₽", 4.0, "d", "i", "Not available")])
+
+    @patch('main.wd.Firefox', side_effect=lambda options: Mock())
+    @patch('main.get_all_listing_items')
+    @patch('main.scrape_product')
+    def test_main_listing(self, mock_scrape_product, mock_get_all_listing_items, mock_firefox):
+        """Проверяет, что в режиме listing открываются только товары, которых нет в предыдущей выгрузке."""
+
+        mock_scrape_product.side_effect = lambda url, driver, number, limiter, **kwargs: create_item_dict(
+            number, url, "New", "1 ₽", 5.0, "d", "i", "c")
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, "products.csv")
+            save_to_csv(get_dataframe([create_item_dict(1, "/p1", "Old", "100 ₽", 4.0, "d1", "i1", "c1")]), csv_path)
+            mock_get_all_listing_items.return_value = [{"link": "/p1", "name": "Old", "price": "90 ₽", "rating": 4.0},
+                                                       {"link": "/p2", "name": "New", "price": "1 ₽"}]
+            with patch('main.STATE_PATH', os.path.join(directory, "state.sqlite3")), patch('main.CSV_PATH', csv_path):
+                main(listing=True)
+            result = pd.read_csv(csv_path)
+
+        self.assertEqual([call.args[0] for call in mock_scrape_product.call_args_list], ["/p2"])
+        self.assertEqual(list(result["link"]), ["/p1", "/p2"])
+        self.assertEqual(list(result["price"]), ["90 ₽", "1 ₽"])
+        self.assertEqual(result["description"][0], "d1")
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "queue.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_crawl(self, queue, categories: list, workers: int = 2) -> None:
+        """Запускает рабочих раньше координатора, как при обходе на нескольких машинах."""
+        worker = threading.Thread(target=run_queue_worker, args=(queue,),
+                                  kwargs={"workers": workers, "driver_factory": Mock, "poll_interval": 0.01})
+        worker.start()
+        time.sleep(0.05)
+        self.assertTrue(worker.is_alive())
+        run_coordinator(queue, categories, poll_interval=0.01)
+        worker.join(timeout=5)
+        self.assertFalse(worker.is_alive())
+
+    def test_incomplete_backend_is_rejected(self):
+        """Проверяет, что реализацию очереди без всех методов нельзя создать."""
+
+        class PartialQueue(WorkQueue):
+            def put(self, kind, urls, category, page=None):
+                return 0
+
+        with self.assertRaises(TypeError):
+            PartialQueue()
+
+    def test_run_state(self):
+        """Проверяет номер обхода и отметку о его завершении."""
+
+        with SqliteWorkQueue(self.path) as queue:
+            self.assertEqual(queue.run_state(), (0, False))
+            self.assertEqual(queue.begin_run(), 1)
+            queue.end_run()
+            self.assertEqual(queue.run_state(), (1, True))
+            self.assertEqual(queue.begin_run(), 2)
+            self.assertEqual(queue.run_state(), (2, False))
+
+    def test_lease_order_and_deduplication(self):
+        """Проверяет, что повторно добавленные URL пропускаются, а страницы каталога выдаются раньше товаров."""
+
+        with SqliteWorkQueue(self.path) as queue:
+            self.assertEqual(queue.put("product", ["/p1", "/p2"], "/cat"), 2)
+            self.assertEqual(queue.put("product", ["/p2", "/p3"], "/cat"), 1)
+            queue.put("listing", ["/cat"], "/cat", 2)
+
+            tasks = queue.lease("w1", limit=2)
+            self.assertEqual([(task.kind, task.url, task.page) for task in tasks],
+                             [("listing", "/cat", 2), ("product", "/p1", None)])
+            self.assertEqual(queue.counts(), {"leased": 2, "pending": 2})
+
+    def test_visibility_timeout(self):
+        """Проверяет, что задачу с истекшей арендой получает другой рабочий, а результат прежнего отклоняется."""
+
+        with SqliteWorkQueue(self.path, visibility_timeout=0.05) as queue:
+            queue.put("product", ["/p1"], "/cat")
+            [stale] = queue.lease("w1")
+            self.assertEqual(queue.lease("w2"), [])
+            time.sleep(0.1)
+            [task] = queue.lease("w2")
+
+            self.assertEqual(task.attempts, 2)
+            self.assertFalse(queue.complete(stale, {"link": "/p1", "name": "old"}))
+            self.assertTrue(queue.complete(task, {"link": "/p1", "name": "new"}))
+            self.assertEqual(list(queue.results()), [{"link": "/p1", "name": "new"}])
+            self.assertTrue(queue.is_drained())
+
+    def test_fail_retries_until_max_attempts(self):
+        """Проверяет повтор неудавшейся задачи и отказ от нее после max_attempts попыток."""
+
+        with SqliteWorkQueue(self.path, max_attempts=2) as queue:
+            queue.put("product", ["/p1"], "/cat")
+            queue.fail(queue.lease("w1")[0], WebDriverException("timeout"))
+            self.assertEqual(queue.counts(), {"pending": 1})
+            queue.fail(queue.lease("w1")[0], WebDriverException("timeout"))
+            self.assertEqual(queue.counts(), {"failed": 1})
+            self.assertEqual(queue.lease("w1"), [])
+
+    def test_concurrent_workers_get_distinct_tasks(self):
+        """Проверяет, что процессы с отдельными соединениями не получают одну и ту же задачу."""
+
+        with SqliteWorkQueue(self.path) as queue:
+            queue.put("product", [f"/p{number}" for number in range(200)], "/cat")
+        leased: list = []
+
+        def worker(name: str) -> None:
+            with SqliteWorkQueue(self.path) as queue:
+                while tasks := queue.lease(name, limit=3):
+                    leased.extend(task.url for task in tasks)
+
+        threads = [threading.Thread(target=worker, args=(f"w{index}",)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(leased), sorted(f"/p{number}" for number in range(200)))
+
+    def test_open_queue(self):
+        """Проверяет выбор реализации очереди по URL."""
+
+        with open_queue("sqlite:///" + self.path) as queue:
+            self.assertIsInstance(queue, SqliteWorkQueue)
+            self.assertEqual(queue.path, self.path)
+        with self.assertRaises(ValueError):
+            open_queue("redis://localhost")
+
+    @patch('main.scrape_product')
+    @patch('main.get_page_products_urls')
+    def test_coordinator_and_workers(self, mock_get_page_products_urls, mock_scrape_product):
+        """Проверяет обход двух категорий рабочими и выгрузку товаров без повторов."""
+
+        catalog = {("/perfume", 1): ["/p1", "/p2"], ("/perfume", 2): ["/p3"], ("/care", 1): ["/p3", "/p4"]}
+        mock_get_page_products_urls.side_effect = lambda driver, page, limiter, url: catalog.get((url, page), [])
+        mock_scrape_product.side_effect = lambda url, driver, number, limiter, **kwargs: create_item_dict(
+            number, url, url.upper())
+        csv_path = os.path.join(self.directory.name, "products.csv")
+
+        with SqliteWorkQueue(self.path) as queue, patch('main.CSV_PATH', csv_path):
+            queue.begin_run()
+            queue.end_run()
+            self.run_crawl(queue, ["/perfume", "/care"])
+
+            result = pd.read_csv(csv_path)
+            self.assertEqual(sorted(result["link"]), ["/p1", "/p2", "/p3", "/p4"])
+            self.assertEqual(list(result["number"]), [1, 2, 3, 4])
+            self.assertEqual(queue.counts(), {"done": 9})
+            self.assertEqual(queue.run_state(), (2, True))
+
+    @patch('main.scrape_product')
+    @patch('main.get_page_products_urls')
+    def test_repeated_runs(self, mock_get_page_products_urls, mock_scrape_product):
+        """Проверяет, что повторный обход на той же очереди заново обходит каталог, а не выгружает прошлые товары."""
+
+        catalog = {("/perfume", 1): ["/p1", "/p2"]}
+        mock_get_page_products_urls.side_effect = lambda driver, page, limiter, url: catalog.get((url, page), [])
+        mock_scrape_product.side_effect = lambda url, driver, number, limiter, **kwargs: create_item_dict(
+            number, url, url.upper())
+        csv_path = os.path.join(self.directory.name, "products.csv")
+
+        with SqliteWorkQueue(self.path) as queue, patch('main.CSV_PATH', csv_path):
+            self.run_crawl(queue, ["/perfume"])
+            self.assertEqual(sorted(pd.read_csv(csv_path)["link"]), ["/p1", "/p2"])
+
+            catalog = {("/perfume", 1): ["/p2", "/p3"]}
+            self.run_crawl(queue, ["/perfume"])
+
+            self.assertEqual(sorted(pd.read_csv(csv_path)["link"]), ["/p2", "/p3"])
+            self.assertEqual(queue.counts(), {"done": 4})
+            self.assertEqual(queue.run_state(), (2, True))
+            self.assertEqual(mock_scrape_product.call_count, 4)
+
+    @patch('main.get_page_products_urls', side_effect=TimeoutException("timeout"))
+    def test_failed_listing_page_is_retried(self, mock_get_page_products_urls):
+        """Проверяет, что незагрузившаяся страница каталога возвращается в очередь, а не завершает категорию."""
+
+        with SqliteWorkQueue(self.path, max_attempts=2) as queue, \
+                patch('main.CSV_PATH', os.path.join(self.directory.name, "products.csv")):
+            self.run_crawl(queue, ["/perfume"], workers=1)
+
+            self.assertEqual(mock_get_page_products_urls.call_count, 2)
+            self.assertEqual(queue.counts(), {"failed": 1})
+
+
+class TestPreflight(unittest.TestCase):
+    def write_selectors(self, directory: str, selectors: dict) -> str:
+        path = os.path.join(directory, "selectors.json")
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(selectors, file)
+        return path
+
+    def test_load_selectors(self):
+        """Проверяет замену селекторов из файла и отказ от неизвестных или некорректных селекторов."""
+
+        with tempfile.TemporaryDirectory() as directory, patch.dict(main_module.SELECTORS):
+            self.assertEqual(load_selectors(os.path.join(directory, "missing.json")), {})
+
+            load_selectors(self.write_selectors(directory, {"NAME_XPATH": "//h1", "COUNTRY_CLASS": "country"}))
+            self.assertEqual((main_module.SELECTORS["NAME_XPATH"], main_module.SELECTORS["COUNTRY_CLASS"]),
+                             ("//h1", "country"))
+            self.assertEqual(extract_item_fields("<div><h1> Name </h1></div>")["name"], "Name")
+            self.assertIn('class="country"', render_product(1).decode("utf-8"))
+
+            with self.assertRaises(ValueError):
+                load_selectors(self.write_selectors(directory, {"NAME": "//h1"}))
+            with self.assertRaises(ValueError):
+                load_selectors(self.write_selectors(directory, {"PRICE_XPATH": "//div["}))
+
+    @patch('main.open_page')
+    @patch('main.get_page_products_urls')
+    def test_run_preflight(self, mock_get_page_products_urls, mock_open_page):
+        """Проверяет долю найденных полей на выборке страниц и прерывание работы при сломанном селекторе."""
+
+        mock_get_page_products_urls.side_effect = lambda driver, page, limiter: [f"/p{page}{i}" for i in range(5)]
+
+        def driver_factory():
+            driver = Mock(page_source=PRODUCT_HTML)
+            driver.execute_async_script.return_value = []
+            return driver
+
+        rates = run_preflight(listing_pages=2, products=4, driver_factory=driver_factory)
+        self.assertEqual(rates, dict.fromkeys(
+            ("items", "name", "price", "rating", "description", "instructions", "country"), 1.0))
+        self.assertEqual(mock_open_page.call_count, 4)
+        check_preflight(rates)
+
+        with patch.dict(main_module.SELECTORS, {"PRICE_XPATH": "//nothing"}):
+            rates = run_preflight(listing_pages=2, products=4, driver_factory=driver_factory)
+        self.assertEqual(rates["price"], 0.0)
+        with self.assertRaises(SystemExit):
+            check_preflight(rates)
+
+    @patch('main.get_all_products_urls')
+    @patch('main.run_preflight', return_value={"items": 1.0, "name": 0.2})
+    def test_main_aborts_on_failed_preflight(self, mock_run_preflight, mock_get_all_products_urls):
+        """Проверяет, что при непройденной проверке селекторов обход не начинается."""
+
+        with self.assertRaises(SystemExit):
+            main(preflight=True)
+        mock_get_all_products_urls.assert_not_called()
+        self.assertEqual(mock_run_preflight.call_args.kwargs["workers"], 1)
+
+
+class TestCleanDataframe(unittest.TestCase):
+    def setUp(self):
+        self.dataframe = get_dataframe([
+            create_item_dict(1, " /p1 ", "  Eau\n Fraiche ", "1\u00a0200 ₽ 1 500 ₽", 4.5, "Описание\t товара ",
+                             "Not available", " Франция "),
+            create_item_dict(2, "/p1", "Повтор", "100 ₽", 5.0, "d", "i", "Италия"),
+            create_item_dict(3, "Not available", "Без ссылки", "100 ₽", 5.0, "d", "i", "Италия"),
+            create_item_dict(4, "/p4", "Product", "0 ₽", 7.0, "   ", "i", "Not available"),
+        ])
+
+    def test_clean_dataframe(self):
+        """Проверяет нормализацию пробелов, пропуски, удаление повторов и проверку диапазонов значений."""
+
+        cleaned = clean_dataframe(self.dataframe)
+
+        self.assertEqual(cleaned["link"].tolist(), ["/p1", "/p4"])
+        self.assertEqual(cleaned["name"].tolist(), ["Eau Fraiche", "Product"])
+        self.assertEqual(cleaned.loc[0, "description"], "Описание товара")
+        self.assertEqual(cleaned.loc[0, "price"], 1200)
+        self.assertTrue(pd.isna(cleaned.loc[1, "price"]))
+        self.assertTrue(pd.isna(cleaned.loc[1, "rating"]))
+        self.assertTrue(cleaned.loc[1, ["description", "country"]].isna().all())
+        self.assertTrue(pd.isna(cleaned.loc[0, "instructions"]))
+        self.assertEqual(list(cleaned["country"].cat.categories), ["Франция"])
+        self.assertEqual({column: str(dtype) for column, dtype in cleaned.dtypes.items()}, {
+            "number": "Int32", "link": "string", "name": "string", "price": "Int32", "rating": "Float32",
+            "description": "string", "instructions": "string", "country": "category"})
+        self.assertEqual(cleaned["name"].dtype.storage, "pyarrow")
+
+    def test_seen_links_across_chunks(self):
+        """Проверяет удаление повторов между частями файла в csv_to_parquet."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, "products.csv")
+            parquet_path = os.path.join(directory, "products.parquet")
+            save_to_csv(self.dataframe, csv_path)
+            csv_to_parquet(csv_path, parquet_path, chunksize=1)
+
+            self.assertEqual(pq.read_table(parquet_path).column("link").to_pylist(), ["/p1", "/p4"])
+
+    def test_benchmark_postprocessing(self):
+        """Проверяет, что построчная и векторная обработка дают одинаковый результат."""
+
+        items = make_raw_products(2000)
+        items[0]["price"] = "1\u00a0200 ₽ 1 500 ₽"
+        expected = clean_rows(items)
+        cleaned = clean_dataframe(get_dataframe(items))
+
+        self.assertEqual(cleaned["link"].tolist(), expected["link"].tolist())
+        self.assertEqual(cleaned["price"].astype(object).where(cleaned["price"].notna(), None).tolist(),
+                         expected["price"].astype(object).where(expected["price"].notna(), None).tolist())
+        self.assertEqual(cleaned["description"].tolist(), expected["description"].tolist())
+        self.assertEqual(expected["price"][0], 1200)
+        self.assertEqual(benchmark_postprocessing(1000)["vectorized_rows"], len(clean_rows(make_raw_products(1000))))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,240 @@
+import abc
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+from checkpoint import MAX_ATTEMPTS
+
+QUEUE_URL = "sqlite:///work_queue.sqlite3"
+VISIBILITY_TIMEOUT = 300
+
+
+class Task(NamedTuple):
+    """Задача из очереди: страница каталога (kind="listing") или страница товара (kind="product")."""
+    id: int
+    kind: str
+    url: str
+    category: str
+    page: int | None
+    attempts: int
+    worker: str
+
+
+class WorkQueue(abc.ABC):
+    """
+    Общая очередь задач обхода для координатора и любого числа рабочих процессов.
+
+    Рабочий процесс берет задачи в аренду (lease) на visibility_timeout секунд. Если за это время задача
+    не отмечена выполненной (complete) или неудавшейся (fail) - например, процесс или машина упали, - она снова
+    становится доступной другим рабочим. После max_attempts попыток задача считается неудавшейся.
+    Координатор начинает обход (begin_run), при этом задачи и результаты предыдущего обхода удаляются, и по его
+    окончании отмечает обход завершенным (end_run); номер обхода позволяет рабочим, запущенным раньше координатора,
+    не принять за конец обхода завершение предыдущего.
+    Подклассы реализуют хранение; доступные реализации регистрируются в QUEUE_BACKENDS по схеме URL.
+    """
+
+    def __init__(self, visibility_timeout: float = VISIBILITY_TIMEOUT, max_attempts: int = MAX_ATTEMPTS):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+    def __enter__(self) -> "WorkQueue":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Метод освобождает ресурсы очереди."""
+
+    @abc.abstractmethod
+    def put(self, kind: str, urls: list, category: str, page: int | None = None) -> int:
+        """Метод добавляет задачи kind для urls (уже добавленные URL пропускаются) и возвращает число новых."""
+
+    @abc.abstractmethod
+    def lease(self, worker: str, limit: int = 1) -> list[Task]:
+        """Метод берет в аренду до limit доступных задач; страницы каталога выдаются раньше товаров."""
+
+    @abc.abstractmethod
+    def complete(self, task: Task, result: dict | None = None) -> bool:
+        """Метод сохраняет результат задачи; возвращает False, если аренда уже истекла и задачу взял другой."""
+
+    @abc.abstractmethod
+    def fail(self, task: Task, error: Exception | str) -> None:
+        """Метод возвращает задачу в очередь или, если попытки исчерпаны, отмечает ее неудавшейся."""
+
+    @abc.abstractmethod
+    def results(self, kind: str = "product"):
+        """Метод последовательно возвращает результаты выполненных задач kind в порядке добавления."""
+
+    @abc.abstractmethod
+    def counts(self) -> dict[str, int]:
+        """Метод возвращает количество задач в каждом статусе."""
+
+    @abc.abstractmethod
+    def begin_run(self) -> int:
+        """
+        Метод начинает новый обход: удаляет задачи предыдущего обхода, увеличивает номер обхода, снимает отметку
+        о завершении и возвращает номер.
+        """
+
+    @abc.abstractmethod
+    def end_run(self) -> None:
+        """Метод отмечает текущий обход завершенным, после чего рабочие процессы останавливаются."""
+
+    @abc.abstractmethod
+    def run_state(self) -> tuple[int, bool]:
+        """Метод возвращает номер текущего обхода (0, если обходов не было) и признак его завершения."""
+
+    def is_drained(self) -> bool:
+        """Метод проверяет, что в очереди не осталось ожидающих и арендованных задач."""
+        counts = self.counts()
+        return not counts.get("pending") and not counts.get("leased")
+
+
+class SqliteWorkQueue(WorkQueue):
+    """
+    Очередь задач в базе SQLite для процессов на одной машине.
+
+    Аренда выполняется в транзакции BEGIN IMMEDIATE, поэтому одну задачу не получат два процесса. Для нескольких
+    машин нужна реализация WorkQueue поверх сетевого хранилища: SQLite на сетевом диске блокировки не гарантирует.
+    """
+
+    def __init__(self, path: str, visibility_timeout: float = VISIBILITY_TIMEOUT, max_attempts: int = MAX_ATTEMPTS):
+        super().__init__(visibility_timeout, max_attempts)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                category TEXT NOT NULL,
+                page INTEGER,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL,
+                worker TEXT,
+                error TEXT,
+                result TEXT,
+                UNIQUE (kind, url, page)
+            );
+            CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, kind, id);
+            CREATE TABLE IF NOT EXISTS run (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                generation INTEGER NOT NULL,
+                finished INTEGER NOT NULL
+            );
+        """)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Контекстный менеджер транзакции, которая сразу блокирует базу на запись для других процессов."""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def put(self, kind: str, urls: list, category: str, page: int | None = None) -> int:
+        with self.lock:
+            before = self.connection.total_changes
+            # UNIQUE не срабатывает на NULL, поэтому у задач товаров вместо номера страницы хранится 0
+            with self.transaction():
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO tasks (kind, url, category, page) VALUES (?, ?, ?, ?)",
+                    ((kind, _url, category, page or 0) for _url in urls)
+                )
+            return self.connection.total_changes - before
+
+    def lease(self, worker: str, limit: int = 1) -> list[Task]:
+        now = time.time()
+        with self.lock:
+            with self.transaction():
+                self.connection.execute(
+                    "UPDATE tasks SET status = 'failed', error = 'lease expired' "
+                    "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                    (now, self.max_attempts)
+                )
+                rows = self.connection.execute(
+                    "SELECT id, kind, url, category, page, attempts FROM tasks "
+                    "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                    "ORDER BY kind = 'product', id LIMIT ?",
+                    (now, limit)
+                ).fetchall()
+                self.connection.executemany(
+                    "UPDATE tasks SET status = 'leased', attempts = attempts + 1, lease_until = ?, worker = ? "
+                    "WHERE id = ?",
+                    ((now + self.visibility_timeout, worker, row[0]) for row in rows)
+                )
+        return [Task(task_id, kind, _url, category, page or None, attempts + 1, worker)
+                for task_id, kind, _url, category, page, attempts in rows]
+
+    def complete(self, task: Task, result: dict | None = None) -> bool:
+        with self.lock:
+            cursor = self.connection.execute(
+                "UPDATE tasks SET status = 'done', error = NULL, result = ? "
+                "WHERE id = ? AND status = 'leased' AND worker = ? AND attempts = ?",
+                (json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 task.id, task.worker, task.attempts)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, task: Task, error: Exception | str) -> None:
+        with self.lock:
+            self.connection.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, error = ? "
+                "WHERE id = ? AND status = 'leased' AND worker = ? AND attempts = ?",
+                (self.max_attempts, str(error).strip() or type(error).__name__, task.id, task.worker, task.attempts)
+            )
+
+    def results(self, kind: str = "product"):
+        cursor = self.connection.execute(
+            "SELECT result FROM tasks WHERE kind = ? AND status = 'done' AND result IS NOT NULL ORDER BY id", (kind,)
+        )
+        for (result,) in cursor:
+            yield json.loads(result)
+
+    def counts(self) -> dict[str, int]:
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+
+    def begin_run(self) -> int:
+        with self.lock:
+            with self.transaction():
+                # Иначе UNIQUE (kind, url, page) не даст добавить те же страницы снова, а results() вернет
+                # товары прошлого обхода; аренды прошлого обхода после этого не подтвердятся (complete вернет False)
+                self.connection.execute("DELETE FROM tasks")
+                self.connection.execute("INSERT OR IGNORE INTO run (id, generation, finished) VALUES (1, 0, 0)")
+                self.connection.execute("UPDATE run SET generation = generation + 1, finished = 0 WHERE id = 1")
+                (generation,) = self.connection.execute("SELECT generation FROM run WHERE id = 1").fetchone()
+        return generation
+
+    def end_run(self) -> None:
+        with self.lock:
+            self.connection.execute("UPDATE run SET finished = 1 WHERE id = 1")
+
+    def run_state(self) -> tuple[int, bool]:
+        row = self.connection.execute("SELECT generation, finished FROM run WHERE id = 1").fetchone()
+        return (row[0], bool(row[1])) if row else (0, False)
+
+
+# Реализации очереди по схеме URL; для очереди на несколько машин сюда добавляется, например, "redis"
+# (для sqlite:///relative.sqlite3 и sqlite:////absolute.sqlite3 путь к файлу - все после третьей косой черты)
+QUEUE_BACKENDS = {"sqlite": lambda location, **kwargs: SqliteWorkQueue(location[1:], **kwargs)}
+
+
+def open_queue(url: str = QUEUE_URL, **kwargs) -> WorkQueue:
+    """Функция открывает очередь по URL вида "<схема>://<адрес>", например "sqlite:///work_queue.sqlite3"."""
+    scheme, separator, location = url.partition("://")
+    if not separator or scheme not in QUEUE_BACKENDS:
+        raise ValueError("Неизвестная очередь задач: {} (доступны: {})".format(url, ", ".join(QUEUE_BACKENDS)))
+    return QUEUE_BACKENDS[scheme](location, **kwargs)